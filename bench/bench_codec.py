@@ -0,0 +1,61 @@
+###############################################################################
+# SPDX-License-Identifier: MIT
+# Copyright 2020 by EV3 Robo Dog Authros
+###############################################################################
+"""Throughput and payload size of the RPC mailbox codecs.
+
+Run on CPython from the repository root:
+
+    python bench/bench_codec.py
+"""
+import sys
+import time
+
+sys.path.insert(0, 'dog')
+
+import codec
+
+SYSTEM_STRINGS = ('QUIT', 'PING', 'REPR', 'BATCH', 'PONG', 'Ok')
+PATHS = ('legs.stand_up', 'legs.right.stand_up', 'legs.right.upper.angle')
+
+# Representative frames as they are put on the `cmd` and `res` mailboxes.
+FRAMES = (
+    ('ping', (4711, 0, ((1, 'PING', (), {}),))),
+    ('stand_up', (4711, 1, ((2, 'legs.right.stand_up', (50, 62), {}),))),
+    ('result', (2, ((2, 200, 'Ok', None),))),
+    ('angle', (3, ((3, 200, 'Ok', 59.5),))),
+    ('batch', (4711, 3, ((4, 'BATCH', (tuple(
+        (path, (), {}) for path in (
+            'legs.right.upper.angle', 'legs.right.lower.angle',
+            'legs.left.upper.angle', 'legs.left.lower.angle')),), {}),))),
+)
+
+ROUNDS = 20000
+
+
+def measure(func, arg):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        func(arg)
+    return ROUNDS / (time.perf_counter() - start)
+
+
+def main():
+    codecs = (
+        ('pickle', codec.PickleCodec()),
+        ('binary', codec.BinaryCodec(SYSTEM_STRINGS + PATHS)),
+    )
+    print('%-10s %-8s %6s %12s %12s' % (
+        'frame', 'codec', 'bytes', 'encode/s', 'decode/s'))
+    for name, frame in FRAMES:
+        for codec_name, frame_codec in codecs:
+            data = frame_codec.encode(frame)
+            assert frame_codec.decode(data) == frame
+            print('%-10s %-8s %6d %12.0f %12.0f' % (
+                name, codec_name, len(data),
+                measure(frame_codec.encode, frame),
+                measure(frame_codec.decode, data)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,326 @@
+###############################################################################
+# SPDX-License-Identifier: MIT
+# Copyright 2020 by EV3 Robo Dog Authros
+###############################################################################
+"""End to end latency and throughput of RPC calls.
+
+Runs the unchanged `RPCServer.run` loop in a thread against an `RPCClient`
+over a local transport: the simulated Bluetooth mailboxes or a socket. The
+server's root is a stand-in for `Front` whose methods return right away, so
+only the RPC layer is measured. Run on CPython from the repository root:
+
+    python bench/bench_rpc.py [--transport sim|unix|tcp] [--json out.json]
+    python bench/bench_rpc.py --compare old.json
+
+Besides the latency percentiles, the mean latency is split into the time
+spent in the codec on both ends, in `RPCServer.execute` (resolving and
+running the call) and the rest, which is the transport and waiting. Bytes
+per call count what is put on both mailboxes. The server's log output is
+muted, as it would otherwise dominate the results.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import _thread
+
+sys.path[:0] = ['sim', 'dog']
+
+import constants, rpc, transport
+
+ROUNDS = 2000
+PIPELINED_ROUNDS = 2000
+WARMUP_ROUNDS = 50
+
+# Name, path and arguments of the measured calls. Exported paths are called
+# by handle, the others by path.
+CALLS = (
+    ('ping', 'PING', ()),
+    ('repr', 'REPR', ('legs',)),
+    ('stand_up', 'legs.stand_up', (100,)),
+    ('angle', 'legs.right.upper.angle', ()),
+    ('speed_by_path', 'legs.right.upper.speed', ()),
+)
+
+
+class StandInMotor:
+
+    def angle(self):
+        return 42
+
+    def speed(self):
+        return 0
+
+
+class StandInLeg:
+
+    MOTIONS = ('reset', 'stand_up', 'lift_up')
+
+    def __init__(self):
+        self.upper = StandInMotor()
+        self.lower = StandInMotor()
+        self.locks = (_thread.allocate_lock(),)
+
+    def reset(self):
+        pass
+
+    def stand_up(self, percent=100, speed=None, wait=True):
+        pass
+
+    def lift_up(self, percent=100, speed=None, wait=True):
+        pass
+
+    def stalled(self):
+        return ()
+
+    def join(self):
+        pass
+
+
+class StandInLegSet:
+
+    MOTIONS = ('reset', 'stand_up', 'wait')
+
+    def __init__(self):
+        self.right = StandInLeg()
+        self.left = StandInLeg()
+        self.locks = self.right.locks + self.left.locks
+
+    def reset(self, force=False):
+        return False
+
+    def stand_up(self, percent=100, speed=None, wait=True):
+        pass
+
+    def wait(self):
+        pass
+
+    def stalled(self):
+        return ()
+
+    def join(self):
+        pass
+
+    def __repr__(self):
+        return '<LegSet right=%r left=%r>' % (self.right, self.left)
+
+
+class StandInState:
+
+    def snapshot(self):
+        return 0, 0, (), True
+
+
+class StandInFront:
+    """Has every method in `constants.RPC_PATHS`, doing nothing.
+
+    Motions are declared like on `Front`, so they are dispatched to workers.
+    """
+
+    MOTIONS = ('reset', 'play_trajectory')
+
+    def __init__(self):
+        self.legs = StandInLegSet()
+        self.locks = self.legs.locks
+        self.state = StandInState()
+
+    def connect(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def reset(self, force=False):
+        return False
+
+    def loop_stats(self, reset=False):
+        return {}
+
+    def upload_trajectory(self, keyframes, joints=4):
+        pass
+
+    def play_trajectory(self, repeat=1, wait=False):
+        pass
+
+    def telemetry_dump(self):
+        return b''
+
+    def stalled(self):
+        return ()
+
+    def join(self):
+        pass
+
+
+class CountingCodec:
+    """Wraps a codec to count the encoded bytes and the time spent."""
+
+    def __init__(self, codec):
+        self.codec = codec
+        self.bytes = 0
+        self.seconds = 0.0
+
+    def reset(self):
+        self.bytes = 0
+        self.seconds = 0.0
+
+    def encode(self, obj):
+        start = time.perf_counter()
+        data = self.codec.encode(obj)
+        self.seconds += time.perf_counter() - start
+        self.bytes += len(data)
+        return data
+
+    def decode(self, data):
+        start = time.perf_counter()
+        obj = self.codec.decode(data)
+        self.seconds += time.perf_counter() - start
+        return obj
+
+
+def getTransport(name):
+    if name == 'sim':
+        return rpc.BluetoothTransport()
+    if name == 'unix':
+        return transport.SocketTransport(
+            os.path.join(tempfile.mkdtemp(), 'rpc.sock'))
+    return transport.SocketTransport(('127.0.0.1', 47110))
+
+
+def getVersion():
+    try:
+        return subprocess.check_output(
+            ('git', 'describe', '--always', '--dirty'),
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def measure_execute(path, args):
+    """Return the mean time in seconds `RPCServer.execute` takes."""
+    server = rpc.RPCServer(StandInFront(), exports=constants.RPC_PATHS)
+    server.resolve_exports()
+    handles = {path: idx for idx, path in enumerate(constants.RPC_PATHS)}
+    call = rpc.RemoteCall(1, handles.get(path, path), args, {})
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        server.execute(call)
+    return (time.perf_counter() - start) / ROUNDS
+
+
+def measure(client, codecs, path, args):
+    for _ in range(WARMUP_ROUNDS):
+        client.call_async(path, args).result()
+    for each in codecs:
+        each.reset()
+    latencies = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        client.call_async(path, args).result()
+        latencies.append(time.perf_counter() - start)
+    codec_seconds = sum(each.seconds for each in codecs) / ROUNDS
+    bytes_per_call = sum(each.bytes for each in codecs) / ROUNDS
+
+    start = time.perf_counter()
+    futures = [
+        client.call_async(path, args) for _ in range(PIPELINED_ROUNDS)]
+    for future in futures:
+        future.result()
+    pipelined = PIPELINED_ROUNDS / (time.perf_counter() - start)
+
+    latencies.sort()
+    mean = sum(latencies) / len(latencies)
+    execute = measure_execute(path, args)
+    us = 1000000
+    return {
+        'path': path,
+        'p50_us': percentile(latencies, 0.50) * us,
+        'p95_us': percentile(latencies, 0.95) * us,
+        'p99_us': percentile(latencies, 0.99) * us,
+        'mean_us': mean * us,
+        'codec_us': codec_seconds * us,
+        'execute_us': execute * us,
+        'transport_us': max(0.0, mean - codec_seconds - execute) * us,
+        'calls_per_s': 1 / mean,
+        'pipelined_calls_per_s': pipelined,
+        'bytes_per_call': bytes_per_call,
+    }
+
+
+def run(transport_name):
+    rpc.tools.print = lambda *args, **kw: None
+    strings = constants.RPC_PATHS
+    server_codec = CountingCodec(rpc.getDefaultCodec(strings))
+    client_codec = CountingCodec(rpc.getDefaultCodec(strings))
+    bench_transport = getTransport(transport_name)
+    server = rpc.RPCServer(
+        StandInFront(), server_codec, constants.RPC_PATHS, bench_transport)
+    server.connect()
+    _thread.start_new_thread(server.run, ())
+    client = rpc.RPCClient('bench', client_codec, bench_transport)
+    client.connect()
+    results = {
+        name: measure(client, (server_codec, client_codec), path, args)
+        for name, path, args in CALLS}
+    client.disconnect()
+    return {
+        'version': getVersion(),
+        'python': platform.python_implementation() + ' ' +
+                  platform.python_version(),
+        'transport': transport_name,
+        'rounds': ROUNDS,
+        'calls': results,
+    }
+
+
+def report(results, baseline=None):
+    print('version %s, %s, transport %s' % (
+        results['version'], results['python'], results['transport']))
+    columns = (
+        'p50_us', 'p95_us', 'p99_us', 'codec_us', 'execute_us',
+        'transport_us', 'calls_per_s', 'pipelined_calls_per_s',
+        'bytes_per_call')
+    print('%-14s' % 'call' + ''.join(
+        '%13s' % column.replace('_per_', '/').replace('pipelined_', 'pipe ')
+        for column in columns))
+    for name, stats in results['calls'].items():
+        print('%-14s' % name + ''.join(
+            '%13.1f' % stats[column] for column in columns))
+        if baseline is None or name not in baseline['calls']:
+            continue
+        old = baseline['calls'][name]
+        print('%-14s' % '  change' + ''.join(
+            '%12.1f%%' % (100 * (stats[column] / old[column] - 1))
+            if old[column] else '%13s' % '-'
+            for column in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument(
+        '--transport', choices=('sim', 'unix', 'tcp'), default='sim')
+    parser.add_argument('--json', help='save the results to this file')
+    parser.add_argument(
+        '--compare', help='show the change relative to these results')
+    args = parser.parse_args()
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+    results = run(args.transport)
+    report(results, baseline)
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
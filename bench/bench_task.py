@@ -0,0 +1,97 @@
+###############################################################################
+# SPDX-License-Identifier: MIT
+# Copyright 2020 by EV3 Robo Dog Authros
+###############################################################################
+"""Spawn-and-poll tasks versus the worker pool.
+
+Measures the time to start and join a group of two tasks, nested like
+`LegSet.stand_up` inside `Dog.stand_up`. Run from the repository root, on the
+brick or on CPython:
+
+    brickrun -r pybricks-micropython bench/bench_task.py
+    python bench/bench_task.py
+"""
+import _thread
+import sys
+import time
+
+sys.path.insert(0, 'dog')
+
+import task
+
+try:
+    from time import sleep_ms, ticks_diff, ticks_us
+except ImportError:
+    def sleep_ms(ms):
+        time.sleep(ms / 1000)
+
+    def ticks_us():
+        return int(time.perf_counter() * 1000000)
+
+    def ticks_diff(end, start):
+        return end - start
+
+JOIN_CHECK_INTERVAL = 10
+ROUNDS = 50
+
+
+class SpawnTask:
+    """The previous implementation: a new thread per task, polled join."""
+
+    def __init__(self, func, args=()):
+        self.func = func
+        self.args = args
+        self.lock = _thread.allocate_lock()
+
+    def start(self):
+        self.lock.acquire()
+        _thread.start_new_thread(self.run, ())
+
+    def run(self):
+        self.func(*self.args)
+        self.lock.release()
+
+    def join(self):
+        while self.lock.locked():
+            sleep_ms(JOIN_CHECK_INTERVAL)
+
+
+def noop():
+    pass
+
+
+def spawn_group(func):
+    tasks = [SpawnTask(func), SpawnTask(func)]
+    for each in tasks:
+        each.start()
+    for each in tasks:
+        each.join()
+
+
+def pool_group(func):
+    grp = task.TaskGroup()
+    grp.add(func)
+    grp.add(func)
+    grp.start()
+    grp.join()
+
+
+def measure(name, group):
+    for label, func in (
+            ('flat', noop), ('nested', lambda: group(noop))):
+        start = ticks_us()
+        for _ in range(ROUNDS):
+            group(func)
+        elapsed = ticks_diff(ticks_us(), start) / ROUNDS
+        print('%-6s %-7s %10.0f us/group' % (name, label, elapsed))
+
+
+def main():
+    # Start the pool upfront; that is a one-time cost at startup.
+    task.getPool()
+    measure('spawn', spawn_group)
+    measure('pool', pool_group)
+
+
+if __name__ == '__main__':
+    main()
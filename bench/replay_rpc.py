@@ -0,0 +1,258 @@
+###############################################################################
+# SPDX-License-Identifier: MIT
+# Copyright 2020 by EV3 Robo Dog Authros
+###############################################################################
+"""Replay a recorded RPC session against a stand-in front brick.
+
+Record a session on either brick by setting `constants.RPC_LOG_PATH`, or by
+passing a `recorder.Recorder` to the RPC server or client. Then run on
+CPython from the repository root:
+
+    python bench/replay_rpc.py rpc.log [--speed original|max]
+        [--transport sim|unix|tcp] [--json out.json]
+
+The recorded command frames are sent byte for byte, but for timed calls, to
+the unchanged `RPCServer.run` loop, whose root is the stand-in `Front` of
+`bench_rpc`. The latency of a call is the time from the first command frame
+carrying it to the first result frame answering it, both in the recording
+and in the replay. Motions of the stand-in return right away, so the replay
+measures the RPC layer, while the recording includes the time the motors
+took.
+
+A frame is never sent before the replay has got the results that the
+recorded client had got before sending it, since the frame acknowledges
+them. Beyond that, frames are sent at their recorded times at the original
+speed, and right away at maximum speed.
+
+Timed calls (`AT`) carry a time on the clock of the recorded server, which
+means nothing to the replay. They are rewritten to run right away and left
+out of the latencies, as these would mostly be the recorded waits.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import _thread
+
+sys.path[:0] = ['sim', 'dog']
+
+import bench_rpc, constants, recorder, rpc
+
+# Seconds to wait for the results a frame depends on before sending it
+# anyway, and for the last results at the end.
+RESULT_TIMEOUT = 5.0
+
+
+class RawCodec:
+    """Sends the recorded frames unchanged."""
+
+    def encode(self, data):
+        return data
+
+    def decode(self, data):
+        return bytes(data)
+
+
+def getPathName(path):
+    if path.__class__ is int and 0 <= path < len(constants.RPC_PATHS):
+        return constants.RPC_PATHS[path]
+    return str(path)
+
+
+def isTimed(call):
+    return call[1] == 'AT' and len(call[2]) == 4
+
+
+def untime(frame, codec):
+    """Return a command frame with its timed calls due right away."""
+    session, ack, calls, event_ack = codec.decode(frame)
+    if not any(isTimed(call) for call in calls):
+        return frame
+    calls = tuple(
+        tuple(call[:2]) + ((0,) + tuple(call[2][1:]),) + tuple(call[3:])
+        if isTimed(call) else call
+        for call in calls)
+    # The codec reuses its buffer.
+    return bytes(codec.encode((session, ack, calls, event_ack)))
+
+
+def parse(frames, codec):
+    """Return the steps of the session and the recorded latencies.
+
+    Steps are `(time, mailbox, frame, keys)`, where the keys identify the
+    calls a command frame carries first, or the calls a result frame
+    answers first, as `(session, req_id)`. Paths are keyed the same way.
+    Timed calls get no keys, see the module docs.
+    """
+    steps = []
+    paths = {}
+    sent = {}
+    latencies = {}
+    session = None
+    for frame_time, mailbox, frame in frames:
+        keys = []
+        if mailbox == recorder.CMD:
+            session, _, calls, _ = codec.decode(frame)
+            for call in calls:
+                key = (session, call[0])
+                # One-way calls get no result.
+                if len(call) > 4 or isTimed(call) or key in sent:
+                    continue
+                sent[key] = frame_time
+                paths[key] = getPathName(call[1])
+                keys.append(key)
+            frame = untime(frame, codec)
+        else:
+            _, results, _ = codec.decode(frame)
+            for res in results:
+                key = (session, res[0])
+                if key in sent and key not in latencies:
+                    latencies[key] = frame_time - sent[key]
+                    keys.append(key)
+        steps.append((frame_time, mailbox, frame, keys))
+    return steps, paths, latencies
+
+
+class Replay:
+
+    def __init__(self, transport, codec):
+        self.codec = codec
+        self.sent = {}
+        self.latencies = {}
+        self.session = None
+        server = rpc.RPCServer(
+            bench_rpc.StandInFront(), rpc.getDefaultCodec(constants.RPC_PATHS),
+            constants.RPC_PATHS, transport)
+        server.connect()
+        _thread.start_new_thread(server.run, ())
+        self._client = transport.client()
+        self._client.connect('replay')
+        self.cmd_mbx = transport.mailbox(
+            rpc.COMMAND_MAILBOX_NAME, self._client, RawCodec())
+        self.res_mbx = transport.mailbox(
+            rpc.RESULT_MAILBOX_NAME, self._client, codec)
+        _thread.start_new_thread(self._receive, ())
+
+    def _receive(self):
+        while True:
+            self.res_mbx.wait()
+            frame = self.res_mbx.read()
+            now = time.perf_counter()
+            for res in frame[1]:
+                key = (self.session, res[0])
+                if key in self.sent and key not in self.latencies:
+                    self.latencies[key] = now - self.sent[key]
+
+    def wait_for(self, keys):
+        """Wait until the results of `keys` are in, or for the timeout."""
+        deadline = time.perf_counter() + RESULT_TIMEOUT
+        while time.perf_counter() < deadline:
+            if all(key in self.latencies for key in keys):
+                return True
+            time.sleep(0.0001)
+        return False
+
+    def run(self, steps, original_speed):
+        start = time.perf_counter()
+        needed = []
+        for frame_time, mailbox, frame, keys in steps:
+            if mailbox == recorder.RES:
+                needed.extend(keys)
+                continue
+            # The frame acknowledges these results, so the server would not
+            # send them again.
+            self.wait_for(needed)
+            if original_speed:
+                delay = start + frame_time / 1000000 - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            self.session = self.codec.decode(frame)[0]
+            now = time.perf_counter()
+            for key in keys:
+                self.sent[key] = now
+            self.cmd_mbx.send(frame)
+        self.wait_for(self.sent)
+        return time.perf_counter() - start
+
+
+def summarize(latencies):
+    latencies = sorted(latencies)
+    if not latencies:
+        return {'count': 0, 'p50_us': 0.0, 'p95_us': 0.0, 'mean_us': 0.0}
+    return {
+        'count': len(latencies),
+        'p50_us': bench_rpc.percentile(latencies, 0.50),
+        'p95_us': bench_rpc.percentile(latencies, 0.95),
+        'mean_us': sum(latencies) / len(latencies),
+    }
+
+
+def run(path, speed, transport_name):
+    rpc.tools.print = lambda *args, **kw: None
+    codec = rpc.getDefaultCodec(constants.RPC_PATHS)
+    steps, paths, recorded = parse(recorder.read(path), codec)
+    replay = Replay(bench_rpc.getTransport(transport_name), codec)
+    seconds = replay.run(steps, speed == 'original')
+    us = 1000000
+    calls = {}
+    for name in sorted(set(paths.values())):
+        keys = [key for key, each in paths.items() if each == name]
+        calls[name] = {
+            'recorded': summarize(
+                [recorded[key] for key in keys if key in recorded]),
+            'replayed': summarize(
+                [replay.latencies[key] * us
+                 for key in keys if key in replay.latencies]),
+            'lost': sum(1 for key in keys if key not in replay.latencies),
+        }
+    return {
+        'version': bench_rpc.getVersion(),
+        'log': os.path.basename(path),
+        'speed': speed,
+        'transport': transport_name,
+        'recorded_s': steps[-1][0] / us if steps else 0.0,
+        'replayed_s': seconds,
+        'calls': calls,
+    }
+
+
+def report(results):
+    print('version %s, log %s, speed %s, transport %s' % (
+        results['version'], results['log'], results['speed'],
+        results['transport']))
+    print('session %.3f s recorded, %.3f s replayed' % (
+        results['recorded_s'], results['replayed_s']))
+    columns = ('p50_us', 'p95_us', 'mean_us')
+    print('%-24s%7s' % ('call', 'count') + ''.join(
+        '%13s%13s%9s' % ('rec ' + column, 'rep ' + column, 'change')
+        for column in columns) + '%6s' % 'lost')
+    for name, stats in results['calls'].items():
+        recorded, replayed = stats['recorded'], stats['replayed']
+        line = '%-24s%7d' % (name, recorded['count'])
+        for column in columns:
+            line += '%13.1f%13.1f' % (recorded[column], replayed[column])
+            line += ('%8.1f%%' % (
+                100 * (replayed[column] / recorded[column] - 1))
+                if recorded[column] else '%9s' % '-')
+        print(line + '%6d' % stats['lost'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('log', help='RPC log written by `recorder`')
+    parser.add_argument(
+        '--speed', choices=('original', 'max'), default='original')
+    parser.add_argument(
+        '--transport', choices=('sim', 'unix', 'tcp'), default='sim')
+    parser.add_argument('--json', help='save the results to this file')
+    args = parser.parse_args()
+    results = run(args.log, args.speed, args.transport)
+    report(results)
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
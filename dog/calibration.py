@@ -0,0 +1,54 @@
+###############################################################################
+# SPDX-License-Identifier: MIT
+# Copyright 2020 by EV3 Robo Dog Authros
+###############################################################################
+"""Persisted motor calibration, so that the stall reset can be skipped.
+
+`Leg.reset` drives the motors into their end stops to find their zero angles,
+which is slow and wears the gears. Instead, the motor angles of the parked
+legs are saved on disconnect and restored on the next connect.
+
+A calibration is only used once: it is removed when it is loaded, so that
+after a crash or a power loss, with the legs in an unknown position, the full
+reset runs again. It is also rejected if the motor names do not match or an
+angle is not within `tolerance` of the parked position.
+
+The file holds '<4sHH' magic, number of motors and length of the names, the
+comma separated motor names and one '<h' angle per motor.
+"""
+import os
+import struct
+
+HEADER = '<4sHH'
+MAGIC = b'CAL1'
+
+
+def save(path, names, angles):
+    names = ','.join(names).encode()
+    with open(path, 'wb') as file:
+        file.write(struct.pack(HEADER, MAGIC, len(angles), len(names)))
+        file.write(names)
+        file.write(struct.pack('<%dh' % len(angles), *angles))
+
+
+def load(path, names, tolerance):
+    """Return the saved angles, or None if there is no valid calibration."""
+    try:
+        with open(path, 'rb') as file:
+            data = file.read()
+        os.remove(path)
+    except OSError:
+        return None
+    size = struct.calcsize(HEADER)
+    if len(data) < size:
+        return None
+    magic, count, names_size = struct.unpack_from(HEADER, data)
+    if (magic != MAGIC or count != len(names) or
+            len(data) != size + names_size + 2 * count or
+            data[size:size+names_size].decode() != ','.join(names)):
+        return None
+    angles = struct.unpack_from('<%dh' % count, data, size + names_size)
+    for angle in angles:
+        if abs(angle) > tolerance:
+            return None
+    return angles
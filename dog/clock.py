@@ -0,0 +1,91 @@
+###############################################################################
+# SPDX-License-Identifier: MIT
+# Copyright 2020 by EV3 Robo Dog Authros
+###############################################################################
+"""Brick clock and clock synchronization between two bricks.
+
+Every brick counts milliseconds from its own start. `ClockSync` estimates the
+offset of the remote brick's clock NTP-style using the `PING` system command:
+of several request/response samples the one with the shortest round trip
+gives the best estimate. Motions can then be scheduled on both bricks for the
+same point in time.
+"""
+from array import array
+
+from pybricks import tools
+
+import constants
+
+_watch = tools.StopWatch()
+
+
+def now():
+    return _watch.time()
+
+
+def wait_until(time):
+    delay = time - now()
+    if delay > 0:
+        tools.wait(delay)
+
+
+def at(time, coro):
+    """Coroutine running `coro` at the given time; returns its start time."""
+    while now() < time:
+        yield
+    started = now()
+    yield from coro
+    return started
+
+
+class ClockSync:
+
+    offset = None
+    rtt = None
+
+    def __init__(self, client, samples=constants.CLOCK_SYNC_SAMPLES,
+                 history=constants.CLOCK_SKEW_HISTORY):
+        self.client = client
+        self.samples = samples
+        self.skews = array('l', [0] * history)
+        self.count = 0
+
+    def sync(self):
+        best = None
+        for _ in range(self.samples):
+            sent = now()
+            _, remote = self.client.call_async('PING', (sent,)).result()
+            received = now()
+            rtt = received - sent
+            if best is None or rtt < best[0]:
+                best = (rtt, remote - (sent + received) // 2)
+        self.rtt, self.offset = best
+        return self.offset
+
+    def to_remote(self, time):
+        return time + self.offset
+
+    def to_local(self, time):
+        return time - self.offset
+
+    def lead_time(self):
+        """Time needed to get a call to the remote brick before it is due."""
+        return max(constants.SYNC_LEAD_TIME, 2 * self.rtt)
+
+    def record(self, local_start, remote_start):
+        """Record the skew between the actual start times of both halves."""
+        skew = self.to_local(remote_start) - local_start
+        self.skews[self.count % len(self.skews)] = skew
+        self.count += 1
+        return skew
+
+    def stats(self):
+        count = min(self.count, len(self.skews))
+        skews = self.skews[:count]
+        return {
+            'offset': self.offset,
+            'rtt': self.rtt,
+            'count': self.count,
+            'skew_mean': sum(skews) / count if count else 0,
+            'skew_max': max(abs(skew) for skew in skews) if count else 0,
+        }
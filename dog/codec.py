@@ -0,0 +1,248 @@
+###############################################################################
+# SPDX-License-Identifier: MIT
+# Copyright 2020 by EV3 Robo Dog Authros
+###############################################################################
+"""Mailbox codecs used to put RPC frames on the wire.
+
+The binary codec is a compact struct-based encoding for the small values
+RPC frames consist of: ints, floats, strings and short tuples. Strings known
+to both sides, like method paths, are interned and sent as a single byte.
+Anything else falls back to pickle.
+
+This module does not depend on pybricks, so it can be benchmarked on CPython.
+"""
+import _thread
+import pickle
+import struct
+
+# Type tags. Small non-negative ints and short tuples/lists encode their
+# value/length in the tag itself.
+NONE = 0x00
+TRUE = 0x01
+FALSE = 0x02
+INT8 = 0x03
+INT16 = 0x04
+INT32 = 0x05
+INT64 = 0x06
+FLOAT32 = 0x07
+FLOAT64 = 0x08
+STR = 0x09
+LONG_STR = 0x0A
+BYTES = 0x0B
+DICT = 0x0C
+INTERNED = 0x0D
+PICKLED = 0x0E
+TUPLE = 0x10
+LONG_TUPLE = 0x1F
+LIST = 0x20
+LONG_LIST = 0x2F
+SMALL_INT = 0x80
+
+MAX_SHORT_LEN = 0x0F
+MAX_SMALL_INT = 0x7F
+# Longest string, bytes, container or pickle, as their lengths are sent as
+# unsigned shorts.
+MAX_LEN = 0xFFFF
+# Largest encoding of anything but strings, bytes and containers.
+MAX_SCALAR_SIZE = 9
+
+# Initial size of the encoding buffers. They grow as needed and are reused
+# for the following frames, so encoding a frame allocates just its bytes.
+BUFFER_SIZE = 256
+
+
+def _grow(buf, size):
+    while len(buf) < size:
+        buf.extend(bytes(len(buf)))
+
+
+def _put_len(buf, pos, tag, size):
+    if size > MAX_LEN:
+        raise ValueError(
+            'Too long to encode: %d > %d items or bytes' % (size, MAX_LEN))
+    struct.pack_into('<BH', buf, pos, tag, size)
+    return pos + 3
+
+
+def _put(buf, pos, data):
+    end = pos + len(data)
+    if end > len(buf):
+        _grow(buf, end)
+    buf[pos:end] = data
+    return end
+
+
+class PickleCodec:
+    """The original codec, kept as a fallback."""
+
+    def encode(self, obj):
+        return pickle.dumps(obj)
+
+    def decode(self, data):
+        return pickle.loads(data)
+
+
+class BinaryCodec:
+
+    def __init__(self, strings=()):
+        if len(strings) > 256:
+            raise ValueError('Too many interned strings: %d' % len(strings))
+        self.strings = tuple(strings)
+        self._ids = {string: idx for idx, string in enumerate(self.strings)}
+        self._buffer = bytearray(BUFFER_SIZE)
+        self._busy = _thread.allocate_lock()
+
+    def encode(self, obj):
+        # Frames are encoded into the reused buffer, unless another thread
+        # is encoding with it right now.
+        if not self._busy.acquire(0):
+            return self._encode_frame(obj, bytearray(BUFFER_SIZE))
+        try:
+            return self._encode_frame(obj, self._buffer)
+        finally:
+            self._busy.release()
+
+    def _encode_frame(self, obj, buf):
+        size = self._encode(obj, buf, 0)
+        return bytes(memoryview(buf)[:size])
+
+    def _encode(self, obj, buf, pos):
+        """Encode `obj` into `buf` at `pos` and return the end position."""
+        if pos + MAX_SCALAR_SIZE > len(buf):
+            _grow(buf, pos + MAX_SCALAR_SIZE)
+        if obj is None:
+            buf[pos] = NONE
+        elif obj is True:
+            buf[pos] = TRUE
+        elif obj is False:
+            buf[pos] = FALSE
+        elif isinstance(obj, int):
+            if 0 <= obj <= MAX_SMALL_INT:
+                buf[pos] = SMALL_INT | obj
+            elif -0x80 <= obj < 0x80:
+                struct.pack_into('<Bb', buf, pos, INT8, obj)
+                return pos + 2
+            elif -0x8000 <= obj < 0x8000:
+                struct.pack_into('<Bh', buf, pos, INT16, obj)
+                return pos + 3
+            elif -0x80000000 <= obj < 0x80000000:
+                struct.pack_into('<Bi', buf, pos, INT32, obj)
+                return pos + 5
+            elif -0x8000000000000000 <= obj < 0x8000000000000000:
+                struct.pack_into('<Bq', buf, pos, INT64, obj)
+                return pos + 9
+            else:
+                return self._encode_pickled(obj, buf, pos)
+        elif isinstance(obj, float):
+            # Use single precision whenever the value survives it.
+            struct.pack_into('<Bf', buf, pos, FLOAT32, obj)
+            if struct.unpack_from('<f', buf, pos + 1)[0] == obj:
+                return pos + 5
+            struct.pack_into('<Bd', buf, pos, FLOAT64, obj)
+            return pos + 9
+        elif isinstance(obj, str):
+            idx = self._ids.get(obj)
+            if idx is not None:
+                buf[pos] = INTERNED
+                buf[pos + 1] = idx
+                return pos + 2
+            data = obj.encode()
+            if len(data) < 0x100:
+                struct.pack_into('<BB', buf, pos, STR, len(data))
+                return _put(buf, pos + 2, data)
+            return _put(buf, _put_len(buf, pos, LONG_STR, len(data)), data)
+        elif isinstance(obj, bytes):
+            return _put(buf, _put_len(buf, pos, BYTES, len(obj)), obj)
+        elif isinstance(obj, tuple):
+            return self._encode_items(obj, TUPLE, LONG_TUPLE, buf, pos)
+        elif isinstance(obj, list):
+            return self._encode_items(obj, LIST, LONG_LIST, buf, pos)
+        elif isinstance(obj, dict):
+            pos = _put_len(buf, pos, DICT, len(obj))
+            for key, val in obj.items():
+                pos = self._encode(key, buf, pos)
+                pos = self._encode(val, buf, pos)
+            return pos
+        else:
+            return self._encode_pickled(obj, buf, pos)
+        return pos + 1
+
+    def _encode_items(self, items, tag, long_tag, buf, pos):
+        if len(items) < MAX_SHORT_LEN:
+            buf[pos] = tag | len(items)
+            pos += 1
+        else:
+            pos = _put_len(buf, pos, long_tag, len(items))
+        for item in items:
+            pos = self._encode(item, buf, pos)
+        return pos
+
+    def _encode_pickled(self, obj, buf, pos):
+        data = pickle.dumps(obj)
+        return _put(buf, _put_len(buf, pos, PICKLED, len(data)), data)
+
+    def decode(self, data):
+        obj, _ = self._decode(data, 0)
+        return obj
+
+    def _decode(self, data, pos):
+        tag = data[pos]
+        pos += 1
+        if tag & SMALL_INT:
+            return tag & MAX_SMALL_INT, pos
+        if tag == NONE:
+            return None, pos
+        if tag == TRUE:
+            return True, pos
+        if tag == FALSE:
+            return False, pos
+        if tag == INT8:
+            return struct.unpack_from('<b', data, pos)[0], pos + 1
+        if tag == INT16:
+            return struct.unpack_from('<h', data, pos)[0], pos + 2
+        if tag == INT32:
+            return struct.unpack_from('<i', data, pos)[0], pos + 4
+        if tag == INT64:
+            return struct.unpack_from('<q', data, pos)[0], pos + 8
+        if tag == FLOAT32:
+            return struct.unpack_from('<f', data, pos)[0], pos + 4
+        if tag == FLOAT64:
+            return struct.unpack_from('<d', data, pos)[0], pos + 8
+        if tag == INTERNED:
+            return self.strings[data[pos]], pos + 1
+        if tag == STR:
+            size = data[pos]
+            pos += 1
+            return str(data[pos:pos+size], 'utf-8'), pos + size
+        if tag == LONG_STR:
+            size = struct.unpack_from('<H', data, pos)[0]
+            pos += 2
+            return str(data[pos:pos+size], 'utf-8'), pos + size
+        if tag == BYTES:
+            size = struct.unpack_from('<H', data, pos)[0]
+            pos += 2
+            return bytes(data[pos:pos+size]), pos + size
+        if tag == PICKLED:
+            size = struct.unpack_from('<H', data, pos)[0]
+            pos += 2
+            return pickle.loads(bytes(data[pos:pos+size])), pos + size
+        if tag == DICT:
+            size = struct.unpack_from('<H', data, pos)[0]
+            pos += 2
+            obj = {}
+            for _ in range(size):
+                key, pos = self._decode(data, pos)
+                obj[key], pos = self._decode(data, pos)
+            return obj, pos
+        kind = tag & 0xF0
+        if kind not in (TUPLE, LIST):
+            raise ValueError('Unknown type tag: 0x%02x' % tag)
+        size = tag & MAX_SHORT_LEN
+        if size == MAX_SHORT_LEN:
+            size = struct.unpack_from('<H', data, pos)[0]
+            pos += 2
+        items = []
+        for _ in range(size):
+            item, pos = self._decode(data, pos)
+            items.append(item)
+        return (tuple(items) if kind == TUPLE else items), pos
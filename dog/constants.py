@@ -8,10 +8,20 @@ from pybricks.parameters import Direction, Port
 # Wait time in milliseconds inbetween busy loop iterations.
 DEFAULT_WAIT_TIME = 10
 
+# Rate in Hz of the control loop driving all motions on a brick.
+CONTROL_RATE = 1000 // DEFAULT_WAIT_TIME
+
+# Number of recent control loop ticks kept for timing statistics.
+CONTROL_HISTORY = 256
+
 # The maximum speed of the leg axles. This vlaue has been carefully measured
 # to ensure that the robot stays steady while executing an action.
 MAX_SPEED = 125
 
+# XXX: Needs to be measured on the real robot.
+# The maximum acceleration of the leg axles in deg/s^2.
+MAX_ACCELERATION = 4 * MAX_SPEED
+
 # Default speed for all robot actions.
 DEFAULT_SPEED = MAX_SPEED // 2
 
@@ -22,6 +32,73 @@ RESET_SPEED = -DEFAULT_SPEED
 # carefully measured to allow the legs to fold up but not jam into th emodel.
 RESET_DUTY = 40
 
+# Motor calibrations saved by the leg sets, see `calibration`.
+FRONT_CALIBRATION_PATH = 'front-legs.cal'
+BACK_CALIBRATION_PATH = 'back-legs.cal'
+
+# Maximum distance in degrees of the motors from their reset angles for the
+# legs to count as parked, so that their calibration can be saved.
+CALIBRATION_TOLERANCE = 10
+
+
+# Rate in Hz at which motor telemetry is sampled.
+TELEMETRY_RATE = 50
+
+# Number of telemetry samples kept per motor.
+TELEMETRY_SIZE = 512
+
+# Port of the IR sensor receiving the remote's buttons, see `keypad`.
+KEYPAD_PORT = Port.S4
+
+# Rate in Hz at which the keypad is sampled, the number of samples in a row a
+# button must be reported pressed or released to count, and the time in
+# milliseconds a button must be pressed to count as held.
+KEYPAD_RATE = 20
+KEYPAD_DEBOUNCE = 2
+KEYPAD_HOLD_TIME = 1000
+
+# Rate in Hz at which the front leg state is sampled for the mirror on the
+# back brick, see `mirror`. With STATE_ON_CHANGE, a state is only pushed if it
+# changed, or for the keyframe every STATE_KEYFRAME_INTERVAL milliseconds.
+STATE_RATE = 10
+STATE_ON_CHANGE = True
+STATE_KEYFRAME_INTERVAL = 1000
+
+# Maximum age in milliseconds of the mirrored front leg state for it to be
+# read instead of asking the front brick. Without changes, updates only come
+# with the keyframes.
+STATE_MAX_AGE = 2 * STATE_KEYFRAME_INTERVAL
+
+# Number of ping samples taken to estimate the clock offset between bricks.
+CLOCK_SYNC_SAMPLES = 8
+
+# Number of recent start time skews kept for statistics.
+CLOCK_SKEW_HISTORY = 32
+
+# Minimum time in milliseconds a synchronized motion is scheduled ahead, so
+# the call reaches the remote brick before it is due.
+SYNC_LEAD_TIME = 50
+
+# Number of steps a gait cycle is sampled into.
+GAIT_STEPS = 32
+
+# Duration of a gait cycle in milliseconds.
+GAIT_PERIOD = 2000
+
+# XXX: Stride and lift need to be determined on the real robot.
+# Angle the upper joint sweeps through while a foot is on the ground.
+GAIT_STRIDE_ANGLE = 20
+
+# Fraction of the lift-up angles a foot is lifted during swing.
+GAIT_LIFT = 0.3
+
+# Grid spacing in millimeters of the inverse kinematics lookup tables.
+IK_GRID_STEP = 5
+
+# Precomputed inverse kinematics tables, see `ik.IKTable`.
+FRONT_IK_TABLE_PATH = 'front-leg.ik'
+BACK_IK_TABLE_PATH = 'back-leg.ik'
+
 
 #### Front Leg Set
 
@@ -45,6 +122,15 @@ FRONT_MAX_UPRIGHT_LOWER_ANGLE = 120
 FRONT_MAX_LIFTUP_UPPER_ANGLE = 60
 FRONT_MAX_LIFTUP_LOWER_ANGLE = 40
 
+# XXX: Geometry needs to be measured on the real robot.
+# Segment lengths in millimeters, from hip to knee and from knee to foot.
+FRONT_UPPER_LENGTH = 96
+FRONT_LOWER_LENGTH = 112
+# Geometric angles at the folded up position: the upper segment's angle from
+# pointing straight down and the angle between the two segments.
+FRONT_UPPER_ZERO_ANGLE = -40
+FRONT_LOWER_ZERO_ANGLE = 20
+
 #### Back Leg Set
 
 BACK_RIGHT_LEG_UPPER_PORT = Port.A
@@ -68,3 +154,31 @@ BACK_MAX_UPRIGHT_LOWER_ANGLE = 120
 BACK_MAX_LIFTUP_UPPER_ANGLE = 0
 BACK_MAX_LIFTUP_LOWER_ANGLE = 135
 
+# XXX: Geometry needs to be measured on the real robot.
+BACK_UPPER_LENGTH = 96
+BACK_LOWER_LENGTH = 112
+BACK_UPPER_ZERO_ANGLE = -40
+BACK_LOWER_ZERO_ANGLE = 20
+
+#### RPC
+
+# Method paths called on the front brick. They are exported by the RPC server
+# to be called by handle and interned by the RPC codec. Both bricks must use
+# the same list, so only ever append to it.
+RPC_PATHS = (
+    'legs.reset', 'legs.stand_up',
+    'legs.right.reset', 'legs.right.stand_up', 'legs.right.lift_up',
+    'legs.left.reset', 'legs.left.stand_up', 'legs.left.lift_up',
+    'legs.right.upper.angle', 'legs.right.lower.angle',
+    'legs.left.upper.angle', 'legs.left.lower.angle',
+    'loop_stats', 'upload_trajectory', 'play_trajectory',
+    'legs.wait', 'telemetry_dump', 'reset',
+)
+
+# Log the RPC frames of the brick to this file, see `recorder`.
+RPC_LOG_PATH = None
+
+# Record the bytes allocated and the garbage collections of every RPC call
+# and motion in the metrics, see `Dog.stats`. Costs time, so keep it off but
+# for measuring.
+TRACE_ALLOCATIONS = False
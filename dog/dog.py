@@ -3,123 +3,252 @@
 # Copyright 2020 by EV3 Robo Dog Authros
 ###############################################################################
 """Main Robo Dog functionality."""
-from pybricks import ev3devices, hubs, messaging, parameters, tools
-from pybricks.media.ev3dev import SoundFile
-from pybricks.parameters import Direction, Port, Stop, Button
+import startup
 
-import console, constants, leg, rpc, task
+from pybricks import tools
+
+import clock, constants, leg, metrics, mirror, rpc, scheduler, task, telemetry
+
+# Modules only needed for some actions are imported on first use, since
+# imports are slow on the brick.
+startup.mark('imports')
 
 
 class Back:
     name = 'back'
 
+    telemetry = None
+
     def __init__(self):
         self.legs = leg.BackLegSet()
 
     def connect(self):
         self.legs.connect()
+        self.telemetry = telemetry.Telemetry(
+            self.legs.motors(), self.legs.motor_names())
+        self.telemetry.start(scheduler.getScheduler().loop)
 
     def disconnect(self):
+        self.telemetry.stop(scheduler.getScheduler().loop)
         self.legs.disconnect()
 
+    def telemetry_dump(self):
+        return self.telemetry.dump()
+
 
 class Dog:
 
     back = None
     front = None
 
-    def __init__(self, front_brick_name):
-        self.brick = hubs.EV3Brick()
-        self.front = rpc.RPCClient(front_brick_name)
+    _brick = None
+    _planner = None
+    keypad = None
+
+    def __init__(self, front_brick_name, recorder=None):
+        # Started first thing, to report the time it takes to get ready.
+        self.watch = tools.StopWatch()
+        self.front = rpc.RPCClient(
+            front_brick_name, rpc.getDefaultCodec(constants.RPC_PATHS),
+            recorder=recorder)
+        # Reads of the front legs' state are served from the pushed state,
+        # everything else is still called remotely.
+        self.front.legs = mirror.LegSetMirror(self.front)
         self.back = Back()
+        self.sync = clock.ClockSync(self.front)
+
+    @property
+    def brick(self):
+        if self._brick is None:
+            from pybricks import hubs
+            self._brick = hubs.EV3Brick()
+        return self._brick
+
+    @property
+    def planner(self):
+        if self._planner is None:
+            import planner
+            self._planner = planner.MotionPlanner(self)
+        return self._planner
 
     def connect(self):
+        # Connect the back motors while waiting for Bluetooth.
+        back = task.Task(self.back.connect)
+        back.start()
+        start = startup.now()
         self.front.connect()
-        self.back.connect()
+        self.front.subscribe('STALLED', self.on_stalled)
+        self.front.subscribe('ERROR', self.on_error)
+        self.front.subscribe('STATE', self.front.legs.update)
+        self.front.listen()
+        # Pushes only start with a keyframe after a while.
+        self.front.legs.sync()
+        startup.record('front connect', start)
+        back.result()
+        start = startup.now()
+        self.sync.sync()
+        startup.record('clock sync', start)
 
     def disconnect(self):
+        if self.keypad is not None:
+            self.keypad.stop(scheduler.getScheduler().loop)
         self.stand_up(0)
         self.front.disconnect()
         self.back.disconnect()
 
+    def on_stalled(self, data):
+        req_id, motors = data
+        tools.print('Front motors stalled: ' + ', '.join(motors))
+
+    def on_error(self, data):
+        req_id, message, error = data
+        tools.print('Front call #%d failed: %s: %s' % (req_id, message, error))
+
+    def start_keypad(self, port=constants.KEYPAD_PORT):
+        """Run commands on the buttons of the IR remote, see `keypad`."""
+        import keypad
+        from pybricks import ev3devices
+        from pybricks.parameters import Button
+        dispatcher = keypad.Dispatcher()
+        dispatcher.bind(keypad.PRESS, Button.RIGHT_UP, self.bark, motion=False)
+        dispatcher.bind(keypad.PRESS, Button.RIGHT_DOWN, self.sit)
+        dispatcher.bind(keypad.PRESS, Button.LEFT_UP, self.stand_up, (100,))
+        dispatcher.bind(keypad.PRESS, Button.LEFT_DOWN, self.stand_up, (0,))
+        self.keypad = keypad.Keypad(
+            ev3devices.InfraredSensor(port), dispatcher.emit)
+        self.keypad.start(scheduler.getScheduler().loop)
+
     def bark(self):
+        from pybricks.media.ev3dev import SoundFile
         self.brick.speaker.play_file(SoundFile.DOG_BARK_1)
 
-    def reset(self):
-        reset_grp = task.TaskGroup()
-        reset_grp.add(self.front.legs.reset)
-        reset_grp.add(self.back.legs.reset)
-        reset_grp.start()
-        reset_grp.join()
+    # The front half is started asynchronously, so the back half can work
+    # locally while the call is in flight, instead of needing a thread just
+    # to wait for the Bluetooth round trip.
+
+    def run_synced(self, path, args, back_motion):
+        """Start a front call and a back motion at the same point in time."""
+        start = clock.now() + self.sync.lead_time()
+        front = self.front.call_at(self.sync.to_remote(start), path, args)
+        back_start = scheduler.run(clock.at(start, back_motion))
+        front_start, res = front.result()
+        self.sync.record(back_start, front_start)
+        return res
+
+    def reset(self, force=False):
+        """Reset the legs, unless their saved calibrations could be used."""
+        start = startup.now()
+        front = self.front.reset.call_async(force)
+        back_skipped = self.back.legs.reset(force)
+        front_skipped = front.result()
+        startup.record('reset', start)
+        tools.print('Ready after %d ms (front %s, back %s).' % (
+            self.watch.time(),
+            'calibrated' if front_skipped else 'reset',
+            'calibrated' if back_skipped else 'reset'))
 
     def stand_up(self, pct, speed=constants.DEFAULT_SPEED, wait=True):
-        bend_grp = task.TaskGroup()
-        bend_grp.add(self.front.legs.stand_up, (pct, speed))
-        bend_grp.add(self.back.legs.stand_up, (pct, speed))
-        bend_grp.start()
-        bend_grp.join()
+        self.run_synced(
+            'legs.stand_up', (pct, speed),
+            self.back.legs.stand_up_coro(pct, speed))
 
     def sit(self, speed=constants.DEFAULT_SPEED, wait=True):
-        reset_grp = task.TaskGroup()
-        # Front goes all the way up.
-        reset_grp.add(self.front.legs.stand_up, (100.0, speed))
-        # Back goes all the way down.
-        reset_grp.add(self.back.legs.stand_up, (0.0, speed))
-        reset_grp.start()
-        reset_grp.join()
+        # Front goes all the way up, back goes all the way down.
+        self.run_synced(
+            'legs.stand_up', (100.0, speed),
+            self.back.legs.stand_up_coro(0.0, speed))
+
+    def walk(self, name='trot', cycles=1, period=constants.GAIT_PERIOD):
+        import gait, trajectory
+        walk_gait = gait.GAITS[name]()
+        # Each brick plays its half of the precomputed gait locally.
+        self.front.upload_trajectory(walk_gait.keyframes(
+            ('front-legs-right', 'front-legs-left'), period))
+        back = trajectory.Trajectory(walk_gait.keyframes(
+            ('back-legs-right', 'back-legs-left'), period))
+        self.run_synced(
+            'play_trajectory', (cycles, True),
+            back.play_coro(self.back.legs.motors(), cycles))
+
+    def move(self, targets, speed=constants.MAX_SPEED):
+        """Move all eight joints, see `planner.JOINTS`, arriving together."""
+        return self.planner.move(targets, speed)
+
+    def angles(self, max_age=constants.STATE_MAX_AGE):
+        """Return the (upper, lower) angles of all legs keyed by leg name.
+
+        The front angles are read from the mirror, unless its state is older
+        than `max_age` milliseconds.
+        """
+        age = self.front.legs.age()
+        if age is not None and age <= max_age:
+            legs = (self.front.legs.right, self.front.legs.left)
+            front = [
+                motor.angle() for leg in legs
+                for motor in (leg.upper, leg.lower)]
+        else:
+            # Query all four front motors in a single round trip.
+            with self.front.batch() as batch:
+                for side in ('right', 'left'):
+                    remote_leg = getattr(batch.legs, side)
+                    remote_leg.upper.angle()
+                    remote_leg.lower.angle()
+            front = batch.values()
+        angles = {
+            'front-legs-right': (front[0], front[1]),
+            'front-legs-left': (front[2], front[3]),
+        }
+        for leg in (self.back.legs.right, self.back.legs.left):
+            angles[leg.name] = (leg.upper.angle(), leg.lower.angle())
+        return angles
+
+    def stats(self, reset=False):
+        """Return the metrics of both bricks, see `metrics`."""
+        return {
+            'front': self.front.call_async('STATS', (reset,)).result(),
+            'back': metrics.getRegistry().snapshot(reset),
+        }
+
+    def save_telemetry(self, prefix='telemetry'):
+        """Save the telemetry of both bricks to `<prefix>-front/back.tlm`."""
+        for name, data in (
+                ('front', self.front.telemetry_dump()),
+                ('back', self.back.telemetry_dump())):
+            with open('%s-%s.tlm' % (prefix, name), 'wb') as file:
+                file.write(data)
 
     def lift_paw(self, side, pct, speed=constants.DEFAULT_SPEED, wait=True):
         leg = getattr(self.front.legs, side)
-        leg.lift_up(pct, speed, wait)
+        if wait:
+            leg.lift_up(pct, speed)
+        else:
+            # Nothing to wait for; failures are reported by `on_error`.
+            leg.lift_up.call_oneway(pct, speed)
 
 
 def main():
-    dog = Dog('ev3-dog2')
+    if constants.TRACE_ALLOCATIONS:
+        metrics.getRegistry().trace_allocations()
+    log = None
+    if constants.RPC_LOG_PATH is not None:
+        import recorder
+        log = recorder.Recorder(constants.RPC_LOG_PATH)
+    dog = Dog('ev3-dog2', log)
+    startup.mark('init')
     dog.connect()
     dog.reset()
+    startup.report()
+    try:
+        dog.start_keypad()
+    except OSError:
+        tools.print('No IR sensor, the remote is not available.')
     #dog.stand_up(100)
+    import console
     console.console({'dog': dog})
     #dog.sit()
     #dog.lift_paw('right', 100)
     #dog.lift_paw('right', 0)
 
-    #dog.frontBrick.front.legs.right.upper.stop()
-    #dog.frontBrick.front.legs.right.lower.stop()
-    #uprev = ucur = None
-    #lprev = lcur = None
-    #try:
-    #    while True:
-    #        ucur = dog.frontBrick.front.legs.right.upper.angle()
-    #        if ucur != uprev:
-    #            print('upper', ucur)
-    #            uprev = ucur
-    #        lcur = dog.frontBrick.front.legs.right.lower.angle()
-    #        if lcur != lprev:
-    #            print('lower', lcur)
-    #            lprev = lcur
-    #        tools.wait(100)
-    #except KeyboardInterrupt:
-    #    pass
-    #except:
-    #    dog.disconnect()
-    #    reraise
-
-    #sensor = ev3devices.InfraredSensor(Port.S4)
-    #try:
-    #    while True:
-    #        buttons = sensor.keypad()
-    #        print(buttons)
-    #        if Button.RIGHT_UP in buttons:
-    #            dog.bark()
-    #        if Button.RIGHT_DOWN in buttons:
-    #            dog.sit()
-    #        if Button.LEFT_UP in buttons:
-    #            dog.stand_up(100)
-    #        if Button.LEFT_DOWN in buttons:
-    #            dog.stand_up(0)
-    #        tools.wait(100)
-    #except KeyboardInterrupt:
-    #    pass
     #while True:
     #    cmd = input('Cmd: ')
     #    if cmd == 'quit':
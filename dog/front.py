@@ -3,26 +3,83 @@
 # Copyright 2020 by EV3 Robo Dog Authros
 ###############################################################################
 """Robo Dog Front Brick."""
-import constants, leg, rpc
+import startup
 
+import constants, leg, metrics, mirror, rpc, scheduler, telemetry
 
-class Front:
+startup.mark('imports')
+
+
+class Front(scheduler.Motions):
     name = 'front'
 
+    # See `leg.Leg.MOTIONS`.
+    MOTIONS = ('reset', 'play_trajectory')
+
+    trajectory = None
+    telemetry = None
+    # Pushes the state of the legs, see `mirror`.
+    state = None
+
     def __init__(self):
         self.legs = leg.FrontLegSet()
+        self.locks = self.legs.locks
 
     def connect(self):
         self.legs.connect()
+        self.telemetry = telemetry.Telemetry(
+            self.legs.motors(), self.legs.motor_names())
+        self.telemetry.start(scheduler.getScheduler().loop)
+        if self.state is not None:
+            self.state.start()
 
     def disconnect(self):
+        if self.state is not None:
+            self.state.stop()
+        self.telemetry.stop(scheduler.getScheduler().loop)
         self.legs.disconnect()
 
+    def stalled(self):
+        return self.legs.stalled()
+
+    def reset(self, force=False):
+        """Reset the legs like `LegSet.reset` and report the startup."""
+        skipped = self.legs.reset(force)
+        startup.report()
+        return skipped
+
+    def telemetry_dump(self):
+        return self.telemetry.dump()
+
+    def upload_trajectory(self, keyframes):
+        import trajectory
+        self.trajectory = trajectory.Trajectory(keyframes)
+        return len(self.trajectory)
+
+    def play_trajectory(self, repeat=1, wait=False):
+        if self.trajectory is None:
+            raise ValueError('No trajectory uploaded.')
+        motion = self.trajectory.play_coro(self.legs.motors(), repeat)
+        self.run_motion(motion, wait)
+
+    def loop_stats(self, reset=False):
+        return scheduler.getScheduler().loop.stats(reset)
+
 
 def main():
+    if constants.TRACE_ALLOCATIONS:
+        metrics.getRegistry().trace_allocations()
     fb = Front()
-    server = rpc.RPCServer(fb)
+    log = None
+    if constants.RPC_LOG_PATH is not None:
+        import recorder
+        log = recorder.Recorder(constants.RPC_LOG_PATH)
+    server = rpc.RPCServer(
+        fb, rpc.getDefaultCodec(constants.RPC_PATHS), constants.RPC_PATHS,
+        recorder=log)
+    fb.state = mirror.StatePublisher(fb.legs, server.push)
     server.connect()
+    startup.mark('init')
     server.run()
 
 
@@ -0,0 +1,115 @@
+###############################################################################
+# SPDX-License-Identifier: MIT
+# Copyright 2020 by EV3 Robo Dog Authros
+###############################################################################
+"""Gaits with precomputed joint angle tables.
+
+A gait cycle is sampled into a fixed number of steps. For every leg the upper
+and lower joint angles of each step are computed once, when the gait is
+created, and stored in `array('f')` buffers, so that playing a gait back only
+indexes into the tables and no trigonometry runs in the control loop.
+
+During stance a foot pushes backwards by sweeping the upper joint through the
+stride around its upright angle; during swing it is lifted along a sine arc
+towards the lift-up angles and brought forward again.
+"""
+import math
+from array import array
+
+import constants, ik, leg
+
+# Order of the legs in the phase tuples.
+LEGS = ('front-legs-right', 'front-legs-left', 'back-legs-right',
+        'back-legs-left')
+
+LEG_CLASSES = {
+    'front-legs-right': leg.FrontLeg,
+    'front-legs-left': leg.FrontLeg,
+    'back-legs-right': leg.BackLeg,
+    'back-legs-left': leg.BackLeg,
+}
+
+
+class Gait:
+
+    name = None
+    # Phase offset of each leg within the cycle, as fraction of the cycle.
+    PHASES = None
+    # Fraction of the cycle a foot is on the ground.
+    DUTY = None
+
+    def __init__(self, steps=constants.GAIT_STEPS,
+                 stride=constants.GAIT_STRIDE_ANGLE,
+                 lift=constants.GAIT_LIFT):
+        self.steps = steps
+        self.tables = {}
+        for name, phase in zip(LEGS, self.PHASES):
+            self.tables[name] = self._compute(
+                LEG_CLASSES[name], phase, stride, lift)
+
+    def _compute(self, leg_class, phase, stride, lift):
+        upper = array('f', [0.0] * self.steps)
+        lower = array('f', [0.0] * self.steps)
+        for step in range(self.steps):
+            pos = (step / self.steps - phase) % 1.0
+            if pos < self.DUTY:
+                # Stance: sweep from front to back.
+                sweep = 0.5 - pos / self.DUTY
+                height = 0.0
+            else:
+                # Swing: lift and bring the foot forward again.
+                swing = (pos - self.DUTY) / (1.0 - self.DUTY)
+                sweep = swing - 0.5
+                height = lift * math.sin(math.pi * swing)
+            upper[step] = ik.quantize(
+                leg_class.MAX_UPRIGHT_UPPER_ANGLE + stride * sweep +
+                leg_class.MAX_LIFTUP_UPPER_ANGLE * height,
+                leg_class.UPPER_GEARS)
+            lower[step] = ik.quantize(
+                leg_class.MAX_UPRIGHT_LOWER_ANGLE +
+                leg_class.MAX_LIFTUP_LOWER_ANGLE * height,
+                leg_class.LOWER_GEARS)
+        return upper, lower
+
+    def angles(self, name, step):
+        upper, lower = self.tables[name]
+        step %= self.steps
+        return upper[step], lower[step]
+
+    def keyframes(self, names, period=constants.GAIT_PERIOD):
+        """Return one cycle as trajectory keyframes for the given legs.
+
+        Joint speeds are chosen, so that every joint reaches the angle of a
+        step just when the next step is due, capped at the maximum speed.
+        """
+        interval = period / self.steps
+        keyframes = []
+        for step in range(self.steps):
+            targets = []
+            speeds = []
+            for name in names:
+                for table in self.tables[name]:
+                    delta = abs(table[step] - table[step - 1])
+                    targets.append(table[step])
+                    speeds.append(max(
+                        1.0, min(constants.MAX_SPEED,
+                                 delta * 1000 / interval)))
+            keyframes.append((int(step * interval), targets, speeds))
+        return keyframes
+
+
+class Trot(Gait):
+    """Diagonal leg pairs move together."""
+    name = 'trot'
+    PHASES = (0.0, 0.5, 0.5, 0.0)
+    DUTY = 0.5
+
+
+class Crawl(Gait):
+    """One leg at a time, so three feet are always on the ground."""
+    name = 'crawl'
+    PHASES = (0.75, 0.25, 0.5, 0.0)
+    DUTY = 0.75
+
+
+GAITS = {gait.name: gait for gait in (Trot, Crawl)}
@@ -0,0 +1,170 @@
+###############################################################################
+# SPDX-License-Identifier: MIT
+# Copyright 2020 by EV3 Robo Dog Authros
+###############################################################################
+"""Inverse kinematics lookup tables for the two-segment legs.
+
+Foot positions are given in millimeters relative to the hip, `x` pointing
+forward and `y` pointing down. A table holds the upper and lower joint angles
+for a grid of foot positions, so that placing a foot costs a bilinear
+interpolation instead of solving trigonometry on the brick. Tables are built
+once at first use or loaded from the leg's `IK_TABLE_PATH`, if it has been
+built offline with `IKTable.build(leg_class).save(path)`.
+
+Joint angles are output shaft angles like the ones of the leg motors, where 0
+is the folded up position.
+"""
+import math
+import struct
+from array import array
+
+import constants
+
+NAN = float('nan')
+HEADER = '<4sfffII'
+MAGIC = b'IK01'
+
+
+def forward(leg_class, upper, lower):
+    """Return the foot position for the given joint angles."""
+    alpha = math.radians(leg_class.UPPER_ZERO_ANGLE + upper)
+    knee = math.radians(leg_class.LOWER_ZERO_ANGLE + lower)
+    gamma = alpha - math.pi + knee
+    return (
+        leg_class.UPPER_LENGTH * math.sin(alpha) +
+        leg_class.LOWER_LENGTH * math.sin(gamma),
+        leg_class.UPPER_LENGTH * math.cos(alpha) +
+        leg_class.LOWER_LENGTH * math.cos(gamma))
+
+
+def quantize(angle, gears):
+    """Round a joint angle to the steps of one motor degree."""
+    resolution = gears[0] / gears[1]
+    return round(angle / resolution) * resolution
+
+
+def solve(leg_class, x, y):
+    """Return the joint angles for a foot position or None if unreachable."""
+    upper_len = leg_class.UPPER_LENGTH
+    lower_len = leg_class.LOWER_LENGTH
+    dist = math.sqrt(x * x + y * y)
+    if not dist or dist > upper_len + lower_len:
+        return None
+    cos_knee = (
+        (upper_len ** 2 + lower_len ** 2 - dist ** 2) /
+        (2 * upper_len * lower_len))
+    knee = math.acos(max(-1.0, min(1.0, cos_knee)))
+    # The angle at the hip between the upper segment and the foot. It is
+    # obtuse for folded knees, as the lower segment is the longer one, so it
+    # needs the law of cosines too and not the law of sines.
+    cos_hip = (
+        (upper_len ** 2 + dist ** 2 - lower_len ** 2) /
+        (2 * upper_len * dist))
+    alpha = math.atan2(x, y) + math.acos(max(-1.0, min(1.0, cos_hip)))
+    upper = quantize(
+        math.degrees(alpha) - leg_class.UPPER_ZERO_ANGLE,
+        leg_class.UPPER_GEARS)
+    lower = quantize(
+        math.degrees(knee) - leg_class.LOWER_ZERO_ANGLE,
+        leg_class.LOWER_GEARS)
+    if not (0 <= upper <= leg_class.MAX_UPPER_ANGLE and
+            0 <= lower <= leg_class.MAX_LOWER_ANGLE):
+        return None
+    return upper, lower
+
+
+class IKTable:
+
+    def __init__(self, x_min, y_min, step, columns, rows, upper, lower):
+        self.x_min = x_min
+        self.y_min = y_min
+        self.step = step
+        self.columns = columns
+        self.rows = rows
+        self.upper = upper
+        self.lower = lower
+
+    @classmethod
+    def build(cls, leg_class, step=constants.IK_GRID_STEP):
+        reach = leg_class.UPPER_LENGTH + leg_class.LOWER_LENGTH
+        columns = int(2 * reach / step) + 1
+        rows = int(reach / step) + 1
+        upper = array('f', [NAN] * (columns * rows))
+        lower = array('f', [NAN] * (columns * rows))
+        for row in range(rows):
+            for col in range(columns):
+                angles = solve(leg_class, col * step - reach, row * step)
+                if angles is not None:
+                    idx = row * columns + col
+                    upper[idx], lower[idx] = angles
+        return cls(-reach, 0.0, step, columns, rows, upper, lower)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as file:
+            header = file.read(struct.calcsize(HEADER))
+            magic, x_min, y_min, step, columns, rows = struct.unpack(
+                HEADER, header)
+            if magic != MAGIC:
+                raise ValueError('Not an IK table: %s' % path)
+            upper = array('f', [0.0] * (columns * rows))
+            lower = array('f', [0.0] * (columns * rows))
+            file.readinto(upper)
+            file.readinto(lower)
+        return cls(x_min, y_min, step, columns, rows, upper, lower)
+
+    def save(self, path):
+        with open(path, 'wb') as file:
+            file.write(struct.pack(
+                HEADER, MAGIC, self.x_min, self.y_min, self.step,
+                self.columns, self.rows))
+            file.write(bytes(self.upper))
+            file.write(bytes(self.lower))
+
+    def lookup(self, x, y):
+        """Return the interpolated joint angles for a foot position."""
+        fx = (x - self.x_min) / self.step
+        fy = (y - self.y_min) / self.step
+        col = int(fx)
+        row = int(fy)
+        if not (0 <= col < self.columns - 1 and 0 <= row < self.rows - 1):
+            raise ValueError('Foot position out of range: %r' % ((x, y),))
+        fx -= col
+        fy -= row
+        idx = row * self.columns + col
+        res = []
+        for table in (self.upper, self.lower):
+            top_left = table[idx]
+            top_right = table[idx + 1]
+            bottom_left = table[idx + self.columns]
+            bottom_right = table[idx + self.columns + 1]
+            val = (
+                (top_left * (1 - fx) + top_right * fx) * (1 - fy) +
+                (bottom_left * (1 - fx) + bottom_right * fx) * fy)
+            if val != val:
+                raise ValueError('Foot position out of reach: %r' % ((x, y),))
+            res.append(val)
+        return res[0], res[1]
+
+    def lookup_path(self, points):
+        """Convert a whole foot path into arrays of upper and lower angles."""
+        upper = array('f', [0.0] * len(points))
+        lower = array('f', [0.0] * len(points))
+        for idx, (x, y) in enumerate(points):
+            upper[idx], lower[idx] = self.lookup(x, y)
+        return upper, lower
+
+
+_tables = {}
+
+
+def getTable(leg_class):
+    """Return the IK table of a leg class, preferring a precomputed one."""
+    table = _tables.get(leg_class)
+    if table is None:
+        try:
+            table = IKTable.load(leg_class.IK_TABLE_PATH)
+        except OSError:
+            table = IKTable.build(leg_class)
+        _tables[leg_class] = table
+    return table
@@ -0,0 +1,144 @@
+###############################################################################
+# SPDX-License-Identifier: MIT
+# Copyright 2020 by EV3 Robo Dog Authros
+###############################################################################
+"""Commands bound to the buttons of the IR remote.
+
+The keypad is sampled on the control loop and debounced: a button only
+counts as pressed or released once the sensor reported so for `debounce`
+samples in a row. Every change emits a `press` or `release` event, and a
+button kept pressed for `hold_time` milliseconds emits a `hold` event once.
+
+    dispatcher = keypad.Dispatcher()
+    dispatcher.bind(keypad.PRESS, Button.LEFT_UP, dog.stand_up, (100,))
+    keypad.Keypad(sensor, dispatcher.emit).start(loop)
+
+Sampling only hands the bound commands to the `Dispatcher`, which runs them
+on the task pool, so the keypad is still sampled while a command runs.
+Motions run one at a time. A motion that comes in while another one runs is
+queued, replacing any motion queued before, so that pressing buttons faster
+than the dog moves does not build up a backlog.
+"""
+import _thread
+
+from pybricks import tools
+from pybricks.parameters import Button
+
+import clock, constants, metrics, task
+
+PRESS = 'press'
+RELEASE = 'release'
+HOLD = 'hold'
+
+# The buttons of the IR remote on channel 1.
+BUTTONS = (
+    Button.LEFT_UP, Button.LEFT_DOWN, Button.RIGHT_UP, Button.RIGHT_DOWN,
+    Button.BEACON)
+
+
+class Keypad:
+
+    def __init__(self, sensor, emit, buttons=BUTTONS,
+                 rate=constants.KEYPAD_RATE,
+                 debounce=constants.KEYPAD_DEBOUNCE,
+                 hold_time=constants.KEYPAD_HOLD_TIME):
+        self.sensor = sensor
+        self.emit = emit
+        self.buttons = buttons
+        self.rate = rate
+        self.debounce = debounce
+        self.hold_time = hold_time
+        self._down = [False] * len(buttons)
+        self._held = [False] * len(buttons)
+        self._since = [0] * len(buttons)
+        # Samples in a row that differ from the debounced state.
+        self._changes = [0] * len(buttons)
+        self._sample = None
+
+    def sample(self):
+        pressed = self.sensor.keypad()
+        now = clock.now()
+        for idx, button in enumerate(self.buttons):
+            if (button in pressed) == self._down[idx]:
+                self._changes[idx] = 0
+                if (self._down[idx] and not self._held[idx] and
+                        now - self._since[idx] >= self.hold_time):
+                    self._held[idx] = True
+                    self.emit(HOLD, button)
+                continue
+            self._changes[idx] += 1
+            if self._changes[idx] < self.debounce:
+                continue
+            self._changes[idx] = 0
+            self._down[idx] = not self._down[idx]
+            if self._down[idx]:
+                self._since[idx] = now
+                self._held[idx] = False
+                self.emit(PRESS, button)
+            else:
+                self.emit(RELEASE, button)
+
+    def start(self, loop):
+        # Keep the bound method, so that `stop` removes the same object.
+        self._sample = self.sample
+        loop.add(self._sample, max(1, loop.rate // self.rate))
+
+    def stop(self, loop):
+        loop.remove(self._sample)
+
+
+class Dispatcher:
+    """Runs the commands bound to keypad events on the task pool."""
+
+    def __init__(self, pool=None):
+        self.pool = pool
+        self.bindings = {}
+        self.metrics = metrics.getRegistry()
+        self._lock = _thread.allocate_lock()
+        self._busy = False
+        self._queued = None
+
+    def bind(self, event, button, func, args=(), motion=True):
+        """Call `func(*args)` on `event` of `button`.
+
+        Motions run one at a time, see the module docs; other commands, like
+        barking, run right away.
+        """
+        self.bindings[(event, button)] = (func, args, motion)
+
+    def emit(self, event, button):
+        binding = self.bindings.get((event, button))
+        if binding is None:
+            return
+        self.metrics.count('keypad.events')
+        func, args, motion = binding
+        command = (func, args, metrics.now())
+        if not motion:
+            task.Task(self._run, command).start(self.pool)
+            return
+        with self._lock:
+            if self._busy:
+                if self._queued is not None:
+                    self.metrics.count('keypad.coalesced')
+                self._queued = command
+                return
+            self._busy = True
+        task.Task(self._run_motions, command).start(self.pool)
+
+    def _run(self, func, args, emitted):
+        self.metrics.time('keypad.dispatch', emitted)
+        try:
+            func(*args)
+        except Exception as err:
+            tools.print('Keypad command failed: %r' % err)
+
+    def _run_motions(self, func, args, emitted):
+        # Keep the worker for the queued motions, so they run in order.
+        while True:
+            self._run(func, args, emitted)
+            with self._lock:
+                command, self._queued = self._queued, None
+                if command is None:
+                    self._busy = False
+                    return
+            func, args, emitted = command
@@ -3,15 +3,16 @@
 # Copyright 2020 by EV3 Robo Dog Authros
 ###############################################################################
 """Robo Dog Leg and Leg Set."""
+import _thread
 import math
 
-from pybricks import ev3devices, tools
+from pybricks import ev3devices
 from pybricks.parameters import Direction, Port
 
-import constants, task
+import calibration, constants, ik, metrics, scheduler, startup
 
 
-class Leg:
+class Leg(scheduler.Motions):
 
     UPPER_DIRECTION = None
     UPPER_GEARS = None
@@ -21,6 +22,12 @@ class Leg:
     UPRIGHT_UPPER_ANGLE = None
     UPRIGHT_LOWER_ANGLE = None
 
+    # Methods that move the motors. The RPC server runs them on a worker
+    # while holding `locks`, so that motions do not fight over a leg, joins
+    # the ones started without waiting and reports `stalled` motors
+    # afterwards.
+    MOTIONS = ('reset', 'stand_up', 'lift_up', 'move_foot')
+
     name = None
     upper = None
     lower = None
@@ -29,6 +36,7 @@ class Leg:
         self.name = name
         self.upper_port = upper_port
         self.lower_port = lower_port
+        self.locks = (_thread.allocate_lock(),)
 
     def connect(self):
         self.upper = ev3devices.Motor(
@@ -42,10 +50,38 @@ class Leg:
     def _get_speed_ratios(self, upper_target, lower_target):
         upper_delta = math.fabs(upper_target - self.upper.angle())
         lower_delta = math.fabs(lower_target - self.lower.angle())
-        ratio = upper_delta / lower_delta if lower_delta else 1.0
-        return (ratio, 1.0) if ratio < 1.0 else (1.0, ratio)
-
-    def reset(self):
+        if not upper_delta or not lower_delta:
+            return 1.0, 1.0
+        # The joint with the longer way to go runs at full speed.
+        ratio = upper_delta / lower_delta
+        return (ratio, 1.0) if ratio < 1.0 else (1.0, 1.0 / ratio)
+
+    def _wait_done(self):
+        # Motions are started right before, so this is the time from the
+        # command to done.
+        registry = metrics.getRegistry()
+        start = metrics.now()
+        alloc = registry.alloc_start()
+        # A stalled motor never gets done, see `stalled`.
+        for motor in (self.upper, self.lower):
+            while not motor.control.done() and not motor.control.stalled():
+                yield
+        registry.time('leg.motion', start)
+        registry.allocated('leg.alloc', alloc)
+        if self.upper.control.stalled() or self.lower.control.stalled():
+            registry.count('leg.stalls')
+
+    def stalled(self):
+        """Return the names of the stalled motors."""
+        # Checked after every motion, so do not allocate in the usual case.
+        if not (self.upper.control.stalled() or self.lower.control.stalled()):
+            return ()
+        return tuple(
+            self.name + '-' + joint
+            for joint, motor in (('upper', self.upper), ('lower', self.lower))
+            if motor.control.stalled())
+
+    def reset_coro(self):
         self.upper.stop()
         self.upper.control.limits(actuation=constants.RESET_DUTY)
         self.lower.stop()
@@ -53,9 +89,11 @@ class Leg:
         self.upper.run(constants.RESET_SPEED)
         self.lower.run(constants.RESET_SPEED)
         # Stall detection.
+        start = metrics.now()
         while (not self.upper.control.stalled() or
                not self.lower.control.stalled()):
-            tools.wait(constants.DEFAULT_WAIT_TIME)
+            yield
+        metrics.getRegistry().time('leg.reset_stall', start)
         # Stop all motors
         self.upper.stop()
         self.upper.control.limits(actuation=100)
@@ -67,7 +105,10 @@ class Leg:
         self.lower.hold()
         self.lower.reset_angle(0)
 
-    def stand_up(self, pct, speed=constants.DEFAULT_SPEED, wait=True):
+    def reset(self):
+        scheduler.run(self.reset_coro())
+
+    def stand_up_coro(self, pct, speed=constants.DEFAULT_SPEED):
         if not (0.0 <= pct <= 100.0):
             raise ValueError('Value out of range: %d%%' % pct)
         # Calculate the angles to bend to.
@@ -76,16 +117,15 @@ class Leg:
         # Setup a speed ratio, so that both finish at the same time.
         upper_ratio, lower_ratio = self._get_speed_ratios(
             upper_target, lower_target)
-        # Implement our own wait() so we can run th etwo motors in the same
-        # thread.
         self.upper.run_target(speed*upper_ratio, upper_target, wait=False)
         self.lower.run_target(speed*lower_ratio, lower_target, wait=False)
-        if wait:
-            while (not self.upper.control.done() or
-                   not self.lower.control.done()):
-                tools.wait(constants.DEFAULT_WAIT_TIME)
+        yield from self._wait_done()
 
-    def lift_up(self, pct, speed=constants.DEFAULT_SPEED, wait=True):
+    def stand_up(self, pct, speed=constants.DEFAULT_SPEED, wait=True):
+        motion = self.stand_up_coro(pct, speed)
+        self.run_motion(motion, wait)
+
+    def lift_up_coro(self, pct, speed=constants.DEFAULT_SPEED):
         if not (0.0 <= pct <= 100.0):
             raise ValueError('Value out of range: %d%%' % pct)
         # Calculate the angles to bend to.
@@ -98,18 +138,33 @@ class Leg:
             self.MAX_LIFTUP_LOWER_ANGLE * pct/100
         )
         # Setup a speed ratio, so that both finish at the same time.
-        if lower_angle:
-            ratio = upper_angle / lower_angle
-        else:
-            ratio = 1.0
-        # Implement our own wait() so we can run th etwo motors in the same
-        # thread.
-        self.upper.run_target(speed*ratio, upper_angle, wait=False)
-        self.lower.run_target(speed, lower_angle, wait=False)
-        if wait:
-            while (not self.upper.control.done() or
-                   not self.lower.control.done()):
-                tools.wait(constants.DEFAULT_WAIT_TIME)
+        upper_ratio, lower_ratio = self._get_speed_ratios(
+            upper_angle, lower_angle)
+        self.upper.run_target(speed*upper_ratio, upper_angle, wait=False)
+        self.lower.run_target(speed*lower_ratio, lower_angle, wait=False)
+        yield from self._wait_done()
+
+    def lift_up(self, pct, speed=constants.DEFAULT_SPEED, wait=True):
+        motion = self.lift_up_coro(pct, speed)
+        self.run_motion(motion, wait)
+
+    def move_foot_coro(self, x, y, speed=constants.DEFAULT_SPEED):
+        upper_target, lower_target = ik.getTable(self.__class__).lookup(x, y)
+        # Setup a speed ratio, so that both finish at the same time.
+        upper_ratio, lower_ratio = self._get_speed_ratios(
+            upper_target, lower_target)
+        self.upper.run_target(speed*upper_ratio, upper_target, wait=False)
+        self.lower.run_target(speed*lower_ratio, lower_target, wait=False)
+        yield from self._wait_done()
+
+    def move_foot(self, x, y, speed=constants.DEFAULT_SPEED, wait=True):
+        """Move the foot to a position relative to the hip, see `ik`."""
+        motion = self.move_foot_coro(x, y, speed)
+        self.run_motion(motion, wait)
+
+    def foot_path(self, points):
+        """Convert foot positions into arrays of upper and lower angles."""
+        return ik.getTable(self.__class__).lookup_path(points)
 
 
 class FrontLeg(Leg):
@@ -125,6 +180,14 @@ class FrontLeg(Leg):
     MAX_LIFTUP_UPPER_ANGLE = constants.FRONT_MAX_LIFTUP_UPPER_ANGLE
     MAX_LIFTUP_LOWER_ANGLE = constants.FRONT_MAX_LIFTUP_LOWER_ANGLE
 
+    UPPER_LENGTH = constants.FRONT_UPPER_LENGTH
+    LOWER_LENGTH = constants.FRONT_LOWER_LENGTH
+    UPPER_ZERO_ANGLE = constants.FRONT_UPPER_ZERO_ANGLE
+    LOWER_ZERO_ANGLE = constants.FRONT_LOWER_ZERO_ANGLE
+    MAX_UPPER_ANGLE = MAX_UPRIGHT_UPPER_ANGLE + MAX_LIFTUP_UPPER_ANGLE
+    MAX_LOWER_ANGLE = MAX_UPRIGHT_LOWER_ANGLE + MAX_LIFTUP_LOWER_ANGLE
+    IK_TABLE_PATH = constants.FRONT_IK_TABLE_PATH
+
 
 class BackLeg(Leg):
 
@@ -139,53 +202,131 @@ class BackLeg(Leg):
     MAX_LIFTUP_UPPER_ANGLE = constants.BACK_MAX_LIFTUP_UPPER_ANGLE
     MAX_LIFTUP_LOWER_ANGLE = constants.BACK_MAX_LIFTUP_LOWER_ANGLE
 
+    UPPER_LENGTH = constants.BACK_UPPER_LENGTH
+    LOWER_LENGTH = constants.BACK_LOWER_LENGTH
+    UPPER_ZERO_ANGLE = constants.BACK_UPPER_ZERO_ANGLE
+    LOWER_ZERO_ANGLE = constants.BACK_LOWER_ZERO_ANGLE
+    MAX_UPPER_ANGLE = MAX_UPRIGHT_UPPER_ANGLE + MAX_LIFTUP_UPPER_ANGLE
+    MAX_LOWER_ANGLE = MAX_UPRIGHT_LOWER_ANGLE + MAX_LIFTUP_LOWER_ANGLE
+    IK_TABLE_PATH = constants.BACK_IK_TABLE_PATH
 
-class LegSet:
+
+class LegSet(scheduler.Motions):
     name = None
     LegFactory = None
+    CALIBRATION_PATH = None
 
     RIGHT_UPPER_PORT = None
     RIGHT_LOWER_PORT = None
     LEFT_UPPER_PORT = None
     LEFT_LOWER_PORT = None
 
+    MOTIONS = ('reset', 'stand_up', 'wait')
+
     name = None
     right = None
     left = None
+    calibrated = False
 
     def __init__(self):
         self.right = self.LegFactory(
             self.name+'-right', self.RIGHT_UPPER_PORT, self.RIGHT_LOWER_PORT)
         self.left = self.LegFactory(
             self.name+'-left', self.LEFT_UPPER_PORT, self.LEFT_LOWER_PORT)
+        # Always in the same order, so that locking both cannot deadlock.
+        self.locks = self.right.locks + self.left.locks
 
     def connect(self):
+        start = startup.now()
         self.right.connect()
         self.left.connect()
+        self.calibrated = self.load_calibration()
+        startup.record(self.name + ' connect', start)
 
     def disconnect(self):
-        pass
-
-    def reset(self):
-        reset_grp = task.TaskGroup()
-        reset_grp.add(self.right.reset)
-        reset_grp.add(self.left.reset)
-        reset_grp.start()
-        reset_grp.join()
-
-    def stand_up(self, pct, speed=constants.DEFAULT_SPEED, wait=True):
+        self.save_calibration()
+
+    def load_calibration(self):
+        """Restore the motor angles saved by `save_calibration`, if valid."""
+        if self.CALIBRATION_PATH is None:
+            return False
+        angles = calibration.load(
+            self.CALIBRATION_PATH, self.motor_names(),
+            constants.CALIBRATION_TOLERANCE)
+        if angles is None:
+            return False
+        for motor, angle in zip(self.motors(), angles):
+            motor.reset_angle(angle)
+            motor.hold()
+        return True
+
+    def save_calibration(self):
+        """Save the motor angles, if the legs are calibrated and parked."""
+        if self.CALIBRATION_PATH is None or not self.calibrated:
+            return
+        angles = [motor.angle() for motor in self.motors()]
+        for angle in angles:
+            if abs(angle) > constants.CALIBRATION_TOLERANCE:
+                return
+        calibration.save(self.CALIBRATION_PATH, self.motor_names(), angles)
+
+    def motors(self):
+        return (
+            self.right.upper, self.right.lower,
+            self.left.upper, self.left.lower)
+
+    def motor_names(self):
+        return tuple(
+            leg.name + '-' + joint
+            for leg in (self.right, self.left)
+            for joint in ('upper', 'lower'))
+
+    def stalled(self):
+        return self.right.stalled() + self.left.stalled()
+
+    def wait_coro(self):
+        return scheduler.gather(self.right._wait_done(), self.left._wait_done())
+
+    def wait(self):
+        """Wait until all motors have reached their targets."""
+        scheduler.run(self.wait_coro())
+
+    # Both legs are driven by the same scheduler in the calling thread.
+
+    def reset_coro(self, force=False):
+        """Reset both legs, unless a calibration has been loaded.
+
+        The value is whether the reset has been skipped.
+        """
+        if self.calibrated and not force:
+            return True
+        yield from scheduler.gather(
+            self.right.reset_coro(), self.left.reset_coro())
+        self.calibrated = True
+        return False
+
+    def reset(self, force=False):
+        start = startup.now()
+        skipped = scheduler.run(self.reset_coro(force))
+        startup.record(self.name + ' reset', start)
+        return skipped
+
+    def stand_up_coro(self, pct, speed=constants.DEFAULT_SPEED):
         if not (0.0 <= pct <= 100.0):
             raise ValueError('Value out of range: %d%%' % pct)
-        reset_grp = task.TaskGroup()
-        reset_grp.add(self.right.stand_up, (pct, speed))
-        reset_grp.add(self.left.stand_up, (pct, speed))
-        reset_grp.start()
-        reset_grp.join()
+        return scheduler.gather(
+            self.right.stand_up_coro(pct, speed),
+            self.left.stand_up_coro(pct, speed))
+
+    def stand_up(self, pct, speed=constants.DEFAULT_SPEED, wait=True):
+        motion = self.stand_up_coro(pct, speed)
+        self.run_motion(motion, wait)
 
 
 class FrontLegSet(LegSet):
     name = 'front-legs'
     LegFactory = FrontLeg
+    CALIBRATION_PATH = constants.FRONT_CALIBRATION_PATH
 
     RIGHT_UPPER_PORT = constants.FRONT_RIGHT_LEG_UPPER_PORT
     RIGHT_LOWER_PORT = constants.FRONT_RIGHT_LEG_LOWER_PORT
@@ -196,6 +337,7 @@ class FrontLegSet(LegSet):
 class BackLegSet(LegSet):
     name = 'back-legs'
     LegFactory = BackLeg
+    CALIBRATION_PATH = constants.BACK_CALIBRATION_PATH
 
     RIGHT_UPPER_PORT = constants.BACK_RIGHT_LEG_UPPER_PORT
     RIGHT_LOWER_PORT = constants.BACK_RIGHT_LEG_LOWER_PORT
@@ -0,0 +1,141 @@
+###############################################################################
+# SPDX-License-Identifier: MIT
+# Copyright 2020 by EV3 Robo Dog Authros
+###############################################################################
+"""Fixed-rate control loop with timing instrumentation.
+
+Every tick records how late it started (latency) and how long its callbacks
+ran (duration) into preallocated ring buffers, and counts overruns, i.e.
+ticks whose callbacks did not finish before the next tick was due.
+
+A callback that raises is logged, counted and removed, so that one failing
+device does not stop the loop, and with it every motion on the brick.
+"""
+import _thread
+import sys
+from array import array
+
+from pybricks import tools
+
+import constants, metrics
+
+try:
+    from time import ticks_us
+except ImportError:
+    # Tick on the clock of `tools.wait`, which the simulation speeds up.
+    _watch = tools.StopWatch()
+
+    def ticks_us():
+        return _watch.time() * 1000
+
+ticks_add = metrics.ticks_add
+ticks_diff = metrics.ticks_diff
+
+
+class ControlLoop:
+
+    def __init__(self, rate=constants.CONTROL_RATE,
+                 history=constants.CONTROL_HISTORY):
+        self.rate = rate
+        self.period = 1000000 // rate
+        self.callbacks = []
+        self._lock = _thread.allocate_lock()
+        self.running = False
+        self.latency = array('l', [0] * history)
+        self.duration = array('l', [0] * history)
+        self.reset_stats()
+
+    # Other threads add and remove callbacks while a tick runs, so the list
+    # is replaced rather than changed.
+
+    def add(self, callback, divider=1):
+        """Call `callback` on every `divider`th tick."""
+        # The ticks left until the next call are kept with the callback.
+        with self._lock:
+            self.callbacks = self.callbacks + [[callback, divider, 1]]
+
+    def remove(self, callback):
+        # Compare by identity, as MicroPython does not tell equal bound
+        # methods apart from others.
+        with self._lock:
+            self.callbacks = [
+                entry for entry in self.callbacks if entry[0] is not callback]
+
+    def reset_stats(self):
+        self.ticks = 0
+        self.overruns = 0
+        self.errors = 0
+
+    def tick(self, deadline):
+        start = ticks_us()
+        failed = None
+        for entry in self.callbacks:
+            entry[2] -= 1
+            if entry[2] > 0:
+                continue
+            entry[2] = entry[1]
+            try:
+                entry[0]()
+            except Exception as err:
+                tools.print('Control loop callback %r failed:' % entry[0])
+                sys.print_exception(err)
+                if failed is None:
+                    failed = []
+                failed.append(entry)
+        if failed is not None:
+            with self._lock:
+                self.callbacks = [
+                    entry for entry in self.callbacks
+                    if not any(entry is each for each in failed)]
+            self.errors += len(failed)
+        end = ticks_us()
+        idx = self.ticks % len(self.latency)
+        self.latency[idx] = ticks_diff(start, deadline)
+        self.duration[idx] = ticks_diff(end, start)
+        self.ticks += 1
+        return end
+
+    def run(self):
+        self.running = True
+        deadline = ticks_us()
+        while self.running:
+            now = self.tick(deadline)
+            deadline = ticks_add(deadline, self.period)
+            delay = ticks_diff(deadline, now)
+            if delay >= 0:
+                # Round up, so that ticks never start early.
+                tools.wait((delay + 999) // 1000)
+            else:
+                # Skip the ticks we missed instead of bursting to catch up.
+                self.overruns += 1
+                deadline = now
+
+    def start(self):
+        _thread.start_new_thread(self.run, ())
+
+    def stop(self):
+        self.running = False
+
+    def stats(self, reset=False):
+        """Return timing statistics in microseconds over the recent ticks."""
+        count = min(self.ticks, len(self.latency))
+        latency = self.latency[:count]
+        duration = self.duration[:count]
+        mean = sum(latency) / count if count else 0
+        stats = {
+            'rate': self.rate,
+            'ticks': self.ticks,
+            'overruns': self.overruns,
+            'errors': self.errors,
+            'latency_mean': mean,
+            'latency_max': max(latency) if count else 0,
+            # Mean absolute deviation of the tick start times.
+            'jitter': (
+                sum(abs(val - mean) for val in latency) / count
+                if count else 0),
+            'duration_mean': sum(duration) / count if count else 0,
+            'duration_max': max(duration) if count else 0,
+        }
+        if reset:
+            self.reset_stats()
+        return stats
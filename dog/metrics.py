@@ -0,0 +1,216 @@
+###############################################################################
+# SPDX-License-Identifier: MIT
+# Copyright 2020 by EV3 Robo Dog Authros
+###############################################################################
+"""Lightweight metrics: counters and fixed-bucket latency histograms.
+
+Histograms count durations in microseconds into buckets with fixed upper
+bounds, kept in preallocated arrays, so recording a duration allocates
+nothing. Updates are not locked; losing a count now and then to a race is
+accepted for the lower overhead.
+
+    start = metrics.now()
+    ...
+    metrics.getRegistry().time('server.execute', start)
+
+The RPC server returns a snapshot of its brick's registry for the `STATS`
+system command.
+
+Allocations can be traced as well, to hold hot paths to an allocation
+budget. Tracing costs time, so it is off until `trace_allocations` is
+called. Then, the traced paths record the bytes allocated on the heap in
+between into a histogram and count the garbage collections:
+
+    start = registry.alloc_start()
+    ...
+    registry.allocated('server.alloc', start)
+
+The heap is shared, so what other threads allocate meanwhile is counted too.
+"""
+import gc
+from array import array
+
+try:
+    from time import ticks_add, ticks_diff, ticks_us
+except ImportError:
+    from time import perf_counter
+
+    def ticks_us():
+        return int(perf_counter() * 1000000)
+
+    def ticks_add(ticks, delta):
+        return ticks + delta
+
+    def ticks_diff(end, start):
+        return end - start
+
+# Upper bounds of the histogram buckets in microseconds. The last bucket
+# counts everything above.
+BOUNDS = (
+    100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000,
+    100000, 200000, 500000, 1000000, 2000000, 5000000)
+# Upper bounds of the allocation histogram buckets in bytes.
+ALLOC_BOUNDS = (
+    0, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+try:
+    # MicroPython only tells the bytes in use, and does not count the
+    # collections.
+    _mem_alloc = gc.mem_alloc
+
+    def _heap():
+        return _mem_alloc(), None
+
+    def _start_tracing():
+        pass
+except AttributeError:
+    import tracemalloc
+
+    def _heap():
+        return (
+            tracemalloc.get_traced_memory()[0],
+            sum(stats['collections'] for stats in gc.get_stats()))
+
+    def _start_tracing():
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+_registry = None
+
+
+def getRegistry():
+    global _registry
+    if _registry is None:
+        _registry = Registry()
+    return _registry
+
+
+def now():
+    return ticks_us()
+
+
+class Histogram:
+
+    __slots__ = ('bounds', 'counts', 'count', 'total', 'max')
+
+    def __init__(self, bounds=BOUNDS):
+        self.bounds = bounds
+        self.counts = array('l', [0] * (len(bounds) + 1))
+        self.reset()
+
+    def reset(self):
+        for idx in range(len(self.counts)):
+            self.counts[idx] = 0
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, value):
+        idx = 0
+        for bound in self.bounds:
+            if value <= bound:
+                break
+            idx += 1
+        self.counts[idx] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, fraction):
+        """Return the upper bound of the bucket holding the percentile, or
+        the maximum if that is lower."""
+        rank = fraction * self.count
+        seen = 0
+        for idx, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                if idx < len(self.bounds):
+                    return min(self.bounds[idx], self.max)
+                return self.max
+        return 0
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0,
+            'max': self.max,
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95),
+            'p99': self.percentile(0.99),
+            'buckets': tuple(self.counts),
+        }
+
+
+class Registry:
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    tracing = False
+
+    def histogram(self, name, bounds=BOUNDS):
+        hist = self.histograms.get(name)
+        if hist is None:
+            hist = self.histograms[name] = Histogram(bounds)
+        return hist
+
+    def record(self, name, value):
+        self.histogram(name).record(value)
+
+    def time(self, name, start):
+        """Record the time since `start`, as returned by `now`."""
+        self.histogram(name).record(ticks_diff(ticks_us(), start))
+
+    def trace_allocations(self, enabled=True):
+        if enabled:
+            _start_tracing()
+        self.tracing = enabled
+
+    def alloc_start(self):
+        """Return the heap state to pass to `allocated`, or None if
+        allocations are not traced."""
+        if self.tracing:
+            return _heap()
+        return None
+
+    def allocated(self, name, start):
+        """Record the bytes allocated since `start`, as returned by
+        `alloc_start`, and count the collections as `name + '.gc'`."""
+        if start is None:
+            return
+        used, collections = _heap()
+        if collections is None:
+            # The heap in use only shrinks if a collection ran, and then
+            # the bytes allocated are unknown.
+            collections = 1 if used < start[0] else 0
+            if not collections:
+                self.histogram(name, ALLOC_BOUNDS).record(used - start[0])
+        else:
+            collections -= start[1]
+            self.histogram(name, ALLOC_BOUNDS).record(max(0, used - start[0]))
+        if collections:
+            self.count(name + '.gc', collections)
+
+    def reset(self):
+        for name in self.counters:
+            self.counters[name] = 0
+        for hist in self.histograms.values():
+            hist.reset()
+
+    def snapshot(self, reset=False):
+        snapshot = {
+            'counters': dict(self.counters),
+            'histograms': {
+                name: hist.snapshot()
+                for name, hist in self.histograms.items()},
+            'bounds': BOUNDS,
+            'alloc_bounds': ALLOC_BOUNDS,
+        }
+        if reset:
+            self.reset()
+        return snapshot
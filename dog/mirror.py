@@ -0,0 +1,229 @@
+###############################################################################
+# SPDX-License-Identifier: MIT
+# Copyright 2020 by EV3 Robo Dog Authros
+###############################################################################
+"""Local mirror of the remote brick's leg state, kept fresh by pushes.
+
+Reading a motor angle of the other brick is a Bluetooth round trip. Instead,
+the front brick's `StatePublisher` samples the angle and the done and stalled
+flags of its motors and pushes them as `STATE` events, and the `LegSetMirror`
+on the back brick serves reads from the latest state it received:
+
+    legs = mirror.LegSetMirror(client)
+    client.subscribe('STATE', legs.update)
+    legs.right.upper.angle()    # No round trip.
+    legs.age()                  # Milliseconds since the last update.
+
+Everything that is not mirrored, like the motions, is called remotely as
+before. The state is a flat tuple of an angle and flags per motor, in the
+order of `LegSet.motors`. Events are `(seq, time, values, keyframe)`: a
+keyframe has the full state in `values`, the others just the changed
+`index, value` pairs. Keyframes are pushed every `keyframe_interval`, also if
+nothing changed, so that a mirror that missed an update catches up again.
+"""
+import _thread
+from array import array
+
+from pybricks import tools
+
+import clock, constants, rpc
+
+DONE = 0x01
+STALLED = 0x02
+FIELDS = 2
+
+
+def _getFlags(motor):
+    flags = 0
+    if motor.control.done():
+        flags |= DONE
+    if motor.control.stalled():
+        flags |= STALLED
+    return flags
+
+
+class StatePublisher:
+    """Pushes the state of `legs` with `push(name, data)` in a thread.
+
+    With `on_change`, states are only pushed if they changed (or a keyframe
+    is due), otherwise at `rate`.
+    """
+
+    motors = ()
+
+    def __init__(self, legs, push, rate=constants.STATE_RATE,
+                 on_change=constants.STATE_ON_CHANGE,
+                 keyframe_interval=constants.STATE_KEYFRAME_INTERVAL):
+        self.legs = legs
+        self.push = push
+        self.period = 1000 // rate
+        self.on_change = on_change
+        self.keyframe_interval = keyframe_interval
+        self.running = False
+        # Held while the thread runs.
+        self._running = _thread.allocate_lock()
+        self.seq = 0
+        self.time = 0
+        self._keyframe = None
+        self.values = None
+        self._sent = None
+
+    def start(self):
+        self.motors = self.legs.motors()
+        size = len(self.motors) * FIELDS
+        self.values = array('h', [0] * size)
+        self._sent = array('h', [0] * size)
+        # Start with a keyframe.
+        self._keyframe = None
+        self.running = True
+        self._running.acquire()
+        _thread.start_new_thread(self.run, ())
+
+    def stop(self):
+        self.running = False
+        # Wait for the thread to end, so it is never started twice.
+        self._running.acquire()
+        self._running.release()
+
+    def run(self):
+        try:
+            while self.running:
+                self.publish()
+                tools.wait(self.period)
+        finally:
+            self._running.release()
+
+    def sample(self):
+        pos = 0
+        for motor in self.motors:
+            self.values[pos] = int(motor.angle())
+            self.values[pos + 1] = _getFlags(motor)
+            pos += FIELDS
+
+    def publish(self):
+        self.sample()
+        now = clock.now()
+        if (self._keyframe is None or
+                now - self._keyframe >= self.keyframe_interval):
+            self._keyframe = now
+            values, keyframe = tuple(self.values), True
+        else:
+            values, keyframe = self._get_changes(), False
+            if not values and self.on_change:
+                return
+        for idx, value in enumerate(self.values):
+            self._sent[idx] = value
+        self.seq += 1
+        self.time = now
+        self.push('STATE', (self.seq, now, values, keyframe))
+
+    def _get_changes(self):
+        changes = []
+        for idx, value in enumerate(self.values):
+            if value != self._sent[idx]:
+                changes.append(idx)
+                changes.append(value)
+        return tuple(changes)
+
+    def snapshot(self):
+        """Return the last pushed state as a keyframe."""
+        return self.seq, self.time, tuple(self._sent or ()), True
+
+
+class MotorControlMirror:
+
+    def __init__(self, state, idx):
+        self._state = state
+        self._idx = idx
+
+    def done(self):
+        return bool(self._state.values[self._idx + 1] & DONE)
+
+    def stalled(self):
+        return bool(self._state.values[self._idx + 1] & STALLED)
+
+
+class MotorMirror:
+
+    def __init__(self, state, idx, remote):
+        self._remote = remote
+        self._idx = idx
+        self._state = state
+        self.control = MotorControlMirror(state, idx)
+
+    def __getattr__(self, name):
+        return getattr(self._remote, name)
+
+    def angle(self):
+        return self._state.values[self._idx]
+
+    def age(self):
+        return self._state.age()
+
+
+class LegMirror:
+
+    def __init__(self, state, idx, remote):
+        self._remote = remote
+        self.upper = MotorMirror(state, idx, remote.upper)
+        self.lower = MotorMirror(state, idx + FIELDS, remote.lower)
+
+    def __getattr__(self, name):
+        return getattr(self._remote, name)
+
+
+class LegSetMirror:
+    """Mirror of the remote `legs` of `client`, see the module docs.
+
+    Until the first update arrives, or `sync` is called, reads return zeros
+    and `age` returns None.
+    """
+
+    def __init__(self, client, path='legs'):
+        self._client = client
+        self._remote = rpc.RemoteObject(path, client)
+        self.values = array('h', [0] * (4 * FIELDS))
+        self.seq = None
+        # Time of the latest state on the remote and the local clock.
+        self.time = None
+        self.updated = None
+        self.right = LegMirror(self, 0, self._remote.right)
+        self.left = LegMirror(self, 2 * FIELDS, self._remote.left)
+
+    def __getattr__(self, name):
+        return getattr(self._remote, name)
+
+    def sync(self):
+        """Fetch the current state with a round trip."""
+        self.update(self._client.call_async('state.snapshot').result())
+
+    def update(self, data):
+        """Apply a pushed state, the handler of `STATE` events."""
+        seq, time, values, keyframe = data
+        if not seq:
+            # Nothing has been published yet.
+            return
+        if keyframe:
+            if self.seq is not None and seq <= self.seq:
+                # Like the reply to a `sync` that crossed a newer push.
+                return
+            for idx, value in enumerate(values):
+                self.values[idx] = value
+        elif self.seq is not None and seq == self.seq + 1:
+            for idx in range(0, len(values), 2):
+                self.values[values[idx]] = values[idx + 1]
+        else:
+            # An update was missed, so wait for the next keyframe.
+            return
+        self.seq = seq
+        self.time = time
+        self.updated = clock.now()
+
+    def age(self):
+        """Return the milliseconds since the latest update, or None."""
+        if self.updated is None:
+            return None
+        return clock.now() - self.updated
+
+    def __repr__(self):
+        return '<LegSetMirror %r age=%r>' % (tuple(self.values), self.age())
@@ -0,0 +1,121 @@
+###############################################################################
+# SPDX-License-Identifier: MIT
+# Copyright 2020 by EV3 Robo Dog Authros
+###############################################################################
+"""Whole-body motion planner synchronizing all eight joints.
+
+The motors run trapezoidal speed profiles. A joint moving `d` degrees with
+top speed `v` and acceleration `a` needs `d/v + v/a` (if it reaches top
+speed). Scaling both `v` and `a` of every joint by its share of the longest
+move gives all profiles the same duration, so all joints arrive together.
+"""
+import math
+
+import constants
+
+# Joint order of the targets: the front motors, then the back motors, both
+# like `LegSet.motors()`.
+JOINTS = (
+    'front-legs-right-upper', 'front-legs-right-lower',
+    'front-legs-left-upper', 'front-legs-left-lower',
+    'back-legs-right-upper', 'back-legs-right-lower',
+    'back-legs-left-upper', 'back-legs-left-lower',
+)
+
+FRONT_MOTOR_PATHS = (
+    'legs.right.upper', 'legs.right.lower',
+    'legs.left.upper', 'legs.left.lower',
+)
+
+
+def plan(current, targets, speed=constants.MAX_SPEED,
+         acceleration=constants.MAX_ACCELERATION):
+    """Return the speed and acceleration of every joint and the duration."""
+    deltas = [math.fabs(target - cur) for cur, target in zip(current, targets)]
+    longest = max(deltas)
+    if not longest:
+        return [speed] * len(deltas), [acceleration] * len(deltas), 0
+    speed = min(speed, constants.MAX_SPEED)
+    if longest >= speed * speed / acceleration:
+        duration = longest / speed + speed / acceleration
+    else:
+        duration = 2 * math.sqrt(longest / acceleration)
+    shares = [delta / longest for delta in deltas]
+    # Joints that do not move keep sane limits.
+    speeds = [max(1.0, speed * share) for share in shares]
+    accelerations = [max(1.0, acceleration * share) for share in shares]
+    return speeds, accelerations, duration * 1000
+
+
+class MotionPlanner:
+
+    def __init__(self, dog):
+        self.dog = dog
+
+    def read_angles(self):
+        angles = self.dog.angles()
+        return [
+            angle
+            for name in ('front-legs-right', 'front-legs-left',
+                         'back-legs-right', 'back-legs-left')
+            for angle in angles[name]]
+
+    def read_accelerations(self):
+        """Return the current acceleration limits of all joints."""
+        with self.dog.front.batch() as batch:
+            for path in FRONT_MOTOR_PATHS:
+                batch.call_async(path + '.control.limits')
+        return [limits[1] for limits in batch.values()] + [
+            motor.control.limits()[1]
+            for motor in self.dog.back.legs.motors()]
+
+    def _move_coro(self, legs, targets, speeds, accelerations, restore):
+        motors = legs.motors()
+        for motor, target, speed, accel in zip(
+                motors, targets, speeds, accelerations):
+            # The limits cannot be changed while the motor runs.
+            motor.stop()
+            motor.control.limits(acceleration=accel)
+            motor.run_target(speed, target, wait=False)
+        # Stops at stalled motors, like any other motion of the legs.
+        yield from legs.wait_coro()
+        for motor, accel in zip(motors, restore):
+            motor.stop()
+            motor.control.limits(acceleration=accel)
+            motor.hold()
+
+    def move(self, targets, speed=constants.MAX_SPEED):
+        """Move all joints to their targets, arriving at the same time.
+
+        Returns the planned duration in milliseconds.
+        """
+        if len(targets) != len(JOINTS):
+            raise ValueError('Expected %d targets.' % len(JOINTS))
+        speeds, accelerations, duration = plan(
+            self.read_angles(), targets, speed)
+        restore = self.read_accelerations()
+        # All front commands go out as a single batch, which also waits for
+        # the motors and restores their limits.
+        batch = self.dog.front.batch()
+        for idx, path in enumerate(FRONT_MOTOR_PATHS):
+            batch.call_async(path + '.stop')
+            batch.call_async(
+                path + '.control.limits', (),
+                {'acceleration': accelerations[idx]})
+            batch.call_async(
+                path + '.run_target', (speeds[idx], targets[idx]),
+                {'wait': False})
+        batch.call_async('legs.wait')
+        for idx, path in enumerate(FRONT_MOTOR_PATHS):
+            batch.call_async(path + '.stop')
+            batch.call_async(
+                path + '.control.limits', (), {'acceleration': restore[idx]})
+            batch.call_async(path + '.hold')
+        back = self._move_coro(
+            self.dog.back.legs, targets[4:], speeds[4:], accelerations[4:],
+            restore[4:])
+        batch.results = self.dog.run_synced(
+            'BATCH', (tuple(batch.calls),), back)
+        # Raise any error of the front commands.
+        batch.values()
+        return duration
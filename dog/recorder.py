@@ -0,0 +1,104 @@
+###############################################################################
+# SPDX-License-Identifier: MIT
+# Copyright 2020 by EV3 Robo Dog Authros
+###############################################################################
+"""Recorder of the RPC frames going over the mailboxes.
+
+Pass a recorder to `RPCServer` or `RPCClient` to log every frame they send
+and receive, as encoded by their codec:
+
+    server = rpc.RPCServer(root, codec, exports, recorder=Recorder(path))
+
+The log starts with the magic '<4s'. Every frame follows as '<IBH': the
+microseconds since the previous frame, the mailbox (`CMD` or `RES`) and the
+size of the frame, followed by the frame itself. A frame that is read again
+is only logged once. See `bench/replay_rpc.py` for replaying a log.
+"""
+import _thread
+import struct
+
+import metrics
+
+MAGIC = b'RPR1'
+RECORD = '<IBH'
+
+# Mailboxes of the frames.
+CMD = 0
+RES = 1
+
+
+def read(path):
+    """Return the `(time, mailbox, frame)` of every frame logged at `path`,
+    with the time in microseconds since the first frame."""
+    with open(path, 'rb') as file:
+        data = file.read()
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError('Not an RPC log: %s' % path)
+    size = struct.calcsize(RECORD)
+    pos = len(MAGIC)
+    time = 0
+    frames = []
+    while pos + size <= len(data):
+        delta, mailbox, length = struct.unpack_from(RECORD, data, pos)
+        pos += size
+        time += delta
+        frames.append((time, mailbox, data[pos:pos+length]))
+        pos += length
+    # Count from the first frame rather than from opening the log.
+    if frames:
+        first = frames[0][0]
+        frames = [(time - first, mailbox, frame)
+                  for time, mailbox, frame in frames]
+    return frames
+
+
+class Recorder:
+
+    def __init__(self, path):
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC)
+        self._lock = _thread.allocate_lock()
+        self._last = metrics.now()
+
+    def record(self, mailbox, frame):
+        with self._lock:
+            now = metrics.now()
+            delta = min(metrics.ticks_diff(now, self._last), 0xFFFFFFFF)
+            self._last = now
+            self._file.write(struct.pack(RECORD, delta, mailbox, len(frame)))
+            self._file.write(frame)
+            # The log is most useful after a crash, so do not lose its end.
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def wrap(self, codec, server):
+        """Return `codec` logging the frames of a server's or a client's
+        mailboxes."""
+        if server:
+            return RecordingCodec(codec, self, RES, CMD)
+        return RecordingCodec(codec, self, CMD, RES)
+
+
+class RecordingCodec:
+
+    def __init__(self, codec, recorder, sent, received):
+        self.codec = codec
+        self.recorder = recorder
+        self.sent = sent
+        self.received = received
+        self._last = None
+
+    def encode(self, obj):
+        data = self.codec.encode(obj)
+        self.recorder.record(self.sent, data)
+        return data
+
+    def decode(self, data):
+        # Mailboxes return their latest frame until a new one arrives.
+        if data != self._last:
+            self._last = data
+            self.recorder.record(self.received, data)
+        return self.codec.decode(data)
@@ -3,14 +3,36 @@
 # Copyright 2020 by EV3 Robo Dog Authros
 ###############################################################################
 """Generic RPC Server and Client based on Bluetooth Mailbox."""
-import pickle
+import _thread
+import random
 import sys
 
 from pybricks import messaging, tools
 
+import clock, codec, metrics, task
+
 COMMAND_MAILBOX_NAME = 'cmd'
 RESULT_MAILBOX_NAME = 'res'
 
+# Maximum number of calls in flight. Every command frame carries all of them,
+# so this bounds the frame size.
+MAX_IN_FLIGHT = 8
+# Maximum number of events kept for the client until it acknowledges them.
+MAX_EVENTS = 16
+# Milliseconds without a result frame after which the client sends its
+# command frame again, in case the server has missed it or the client its
+# answer. Mailboxes only hold the latest message, so frames may get lost.
+RESEND_TIMEOUT = 500
+# Log every call. Off by default, since formatting the calls allocates.
+DEBUG = False
+
+# Strings every RPC frame may contain; interned by the default codec.
+SYSTEM_STRINGS = (
+    'QUIT', 'PING', 'REPR', 'BATCH', 'EXPORTS', 'PONG', 'Ok',
+    'AttributeError', 'TypeError', 'ValueError', 'AT',
+    'DONE', 'ERROR', 'STALLED', 'STATS', 'STATE',
+)
+
 Quit = object()
 
 
@@ -32,10 +54,36 @@ class RemoteError(Exception):
     pass
 
 
+def _getResult(status, message, data):
+    if status >= 500:
+        raise RemoteError(message, data)
+    if status >= 400:
+        data = '%s: %s' % (message, data)
+    return data
+
+
+def getDefaultCodec(strings=()):
+    return codec.BinaryCodec(SYSTEM_STRINGS + tuple(strings))
+
+
 class RPCMailbox(messaging.Mailbox):
 
-    def __init__(self, name, connection):
-        super().__init__(name, connection, pickle.dumps, pickle.loads)
+    def __init__(self, name, connection, codec=None):
+        codec = codec if codec is not None else getDefaultCodec()
+        super().__init__(name, connection, codec.encode, codec.decode)
+
+
+class BluetoothTransport:
+    """RPC transport over the bricks' Bluetooth mailboxes."""
+
+    def server(self):
+        return messaging.BluetoothMailboxServer()
+
+    def client(self):
+        return messaging.BluetoothMailboxClient()
+
+    def mailbox(self, name, connection, codec):
+        return RPCMailbox(name, connection, codec)
 
 
 class RemoteObject:
@@ -48,29 +96,120 @@ class RemoteObject:
         self._client = client
 
     def __getattr__(self, name):
-        return RemoteObject(self.path + '.' + name, self._client)
+        # Cache the proxy, so repeated access does not allocate again.
+        obj = self.__class__(self.path + '.' + name, self._client)
+        setattr(self, name, obj)
+        return obj
 
     def __call__(self, *args, **kw):
-        # tools.print('Calling ' + _getCallRepr(self.path, args, kw))
-        cmd = self._client.cmd_mbx.send((self.path, args, kw))
-        self._client.res_mbx.wait()
-        status, message, data = self._client.res_mbx.read()
-        if status >= 500:
-            raise RemoteError(message, data)
-        if status >= 400:
-            data = '%s: %s' % (message, data)
-        return data
+        if DEBUG:
+            tools.print('Calling ' + _getCallRepr(self.path, args, kw))
+        return self._client.call_async(self.path, args, kw).result()
+
+    def call_async(self, *args, **kw):
+        return self._client.call_async(self.path, args, kw)
+
+    def call_oneway(self, *args, **kw):
+        return self._client.call_oneway(self.path, args, kw)
 
     def __repr__(self):
         return RemoteObject('REPR', self._client)(self.path)
 
 
+class BatchObject(RemoteObject):
+    """Remote object whose calls are collected by a `Batch`."""
+
+    def __call__(self, *args, **kw):
+        return self._client.call_async(self.path, args, kw)
+
+    def __repr__(self):
+        return '<BatchObject %s>' % self.path
+
+
+class BatchResult:
+
+    __slots__ = ('_batch', 'index')
+
+    def __init__(self, batch, index):
+        self._batch = batch
+        self.index = index
+
+    def result(self):
+        if self._batch.results is None:
+            raise RuntimeError('Batch has not been sent yet.')
+        return _getResult(*self._batch.results[self.index])
+
+
+class Batch:
+    """Collect calls and send them to the server as a single frame.
+
+    The server runs the calls in order and returns a `(status, message,
+    data)` triple per call, so one call failing does not affect the others:
+
+        with client.batch() as batch:
+            upper = batch.legs.right.upper.angle()
+            lower = batch.legs.right.lower.angle()
+        upper.result(), lower.result()
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self.calls = []
+        self.results = None
+
+    def __getattr__(self, name):
+        return BatchObject(name, self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.send()
+
+    def call_async(self, path, args=(), kw=None):
+        self.calls.append(
+            (self._client._handles.get(path, path), args, kw or {}))
+        return BatchResult(self, len(self.calls) - 1)
+
+    def send_async(self):
+        return self._client.call_async('BATCH', (tuple(self.calls),))
+
+    def send(self):
+        self.results = self.send_async().result()
+
+    def values(self):
+        return [_getResult(*res) for res in self.results]
+
+
+class RemoteFuture:
+    """Handle to the result of a call that is (or was) in flight."""
+
+    __slots__ = ('_client', 'req_id')
+
+    def __init__(self, client, req_id):
+        self._client = client
+        self.req_id = req_id
+
+    def done(self):
+        if self.req_id not in self._client._results:
+            self._client._receive(self._client.res_mbx.read())
+        return self.req_id in self._client._results
+
+    def result(self):
+        return _getResult(*self._client._wait_result(self.req_id))
+
+
 class RemoteCall:
 
-    def __init__(self, path, args=None, kw=None):
+    __slots__ = ('req_id', 'path', 'args', 'kw', 'oneway')
+
+    def __init__(self, req_id, path, args=None, kw=None, oneway=False):
+        self.req_id = req_id
         self.path = path
         self.args = args or ()
         self.kw = kw or {}
+        self.oneway = oneway
 
     def resolve(self, root, path=None):
         path = path if path is not None else self.path
@@ -87,67 +226,359 @@ class RemoteCall:
         return callable(*self.args, **self.kw)
 
     def __repr__(self):
-        return '<RemoteCall %s>' % _getCallRepr(self.path, self.args, self.kw)
+        return '<RemoteCall #%d %s>' % (
+            self.req_id, _getCallRepr(self.path, self.args, self.kw))
 
 
 class RPCServer:
+    """Serve calls on `root` to one client at a time.
+
+    Mailboxes only hold the latest message, so neither side can rely on
+    seeing every frame. Command frames are `(session, ack, calls)` and carry
+    every call the client has not received a result for yet; result frames
+    are `(last_id, results)` and carry every result the client has not
+    acknowledged yet. Both sides simply skip what they have already seen.
+
+    Calls to the methods an object lists in its `MOTIONS` run on a worker
+    while holding the object's `locks`, everything else is answered right
+    away. Results thus come in any order and are matched by request ID.
+    Batches and timed calls hold the locks of all the motions they run, and
+    the locks are only released once the object's `join` has waited for
+    motions started without waiting.
+
+    One-way calls get no result. Instead, the server pushes a `DONE` or
+    `ERROR` event when they are finished. Events are `(event_id, name,
+    data)` and are carried by result frames as `(last_id, results, events)`
+    until the client acknowledges them in its command frames, which are
+    `(session, ack, calls, event_ack)`. A `STALLED` event is pushed whenever
+    a motion ended with stalled motors.
+    """
 
     _server = None
 
     cmd_mbx = None
     res_mbx = None
 
-    def __init__(self, root):
+    def __init__(self, root, codec=None, exports=(), transport=None,
+                 recorder=None):
         self.root = root
+        self.codec = codec if codec is not None else getDefaultCodec()
+        if recorder is not None:
+            self.codec = recorder.wrap(self.codec, server=True)
+        self.transport = (
+            transport if transport is not None else BluetoothTransport())
+        # Paths of callables that are called by handle, which is the
+        # path's index. They are resolved once per connection.
+        self.exports = tuple(exports)
+        self._callables = ()
+        self._owners = {}
+        # The last task run under each lock.
+        self._tasks = {}
+        self._lock = _thread.allocate_lock()
+        self._session = None
+        self._last_id = 0
+        self._unacked = []
+        self._event_id = 0
+        self._events = []
+        self.metrics = metrics.getRegistry()
 
     def connect(self):
-        self._server = messaging.BluetoothMailboxServer()
-        self.cmd_mbx = RPCMailbox(COMMAND_MAILBOX_NAME, self._server)
-        self.res_mbx = RPCMailbox(RESULT_MAILBOX_NAME, self._server)
+        self._server = self.transport.server()
+        self.cmd_mbx = self.transport.mailbox(
+            COMMAND_MAILBOX_NAME, self._server, self.codec)
+        self.res_mbx = self.transport.mailbox(
+            RESULT_MAILBOX_NAME, self._server, self.codec)
+
+    def resolve_exports(self):
+        call = RemoteCall(None, None)
+        self._callables = tuple(
+            call.resolve(self.root, path) for path in self.exports)
+        self._owners = {}
+
+    def _get_owner(self, path):
+        """Return the object whose `locks` to hold while running a call to
+        `path` on a worker, or None if the call is answered right away."""
+        try:
+            return self._owners[path]
+        except (KeyError, TypeError):
+            pass
+        if path.__class__ is int:
+            if not 0 <= path < len(self.exports):
+                return None
+            name = self.exports[path]
+        elif path.__class__ is str:
+            name = path
+        else:
+            return None
+        owner, _, name = name.rpartition('.')
+        try:
+            obj = RemoteCall(None, owner).resolve(self.root) if owner else (
+                self.root)
+        except ServerRpcError:
+            # Leave reporting the error to `execute`.
+            return None
+        owner = obj if name in getattr(obj, 'MOTIONS', ()) else None
+        self._owners[path] = owner
+        return owner
+
+    def _get_owners(self, call):
+        """Return the owners of the motions a call runs, including those run
+        at a time or in a batch."""
+        path, args = call.path, call.args
+        try:
+            if path == 'AT':
+                path, args = args[1], args[2]
+            paths = [sub[0] for sub in args[0]] if path == 'BATCH' else (path,)
+        except (IndexError, KeyError, TypeError):
+            # Leave reporting the error to `execute`.
+            return []
+        owners = []
+        for path in paths:
+            owner = self._get_owner(path)
+            if owner is not None and owner not in owners:
+                owners.append(owner)
+        return owners
 
     def handle(self, call):
+        # Calls by handle are the hot path, so dispatch them first.
+        if call.path.__class__ is int:
+            try:
+                callable = self._callables[call.path]
+            except IndexError:
+                raise ServerRpcError(
+                    IndexError('Unknown handle: %d' % call.path))
+            return callable(*call.args, **call.kw)
         # Handle system commands.
         if call.path == 'QUIT':
             self.root.disconnect()
             return Quit
         if call.path == 'PING':
-            return 'PONG'
+            # Pinging with the caller's time is used for clock sync.
+            return (call.args[0], clock.now()) if call.args else 'PONG'
+        if call.path == 'AT':
+            # Run a call at the given time and report when it started.
+            time, target, args, kw = call.args
+            clock.wait_until(time)
+            started = clock.now()
+            return started, self.handle(
+                RemoteCall(call.req_id, target, args, kw))
         if call.path == 'REPR':
             return repr(call.resolve(self.root, call.args[0]))
+        if call.path == 'EXPORTS':
+            return self.exports
+        if call.path == 'STATS':
+            # A snapshot of the brick's metrics, optionally resetting them.
+            return self.metrics.snapshot(*call.args)
+        if call.path == 'BATCH':
+            return [
+                self.execute(RemoteCall(call.req_id, *sub))[:3]
+                for sub in call.args[0]]
         # Run the command regularly.
-        return call.call(self.root)
+        start = metrics.now()
+        callable = call.resolve(self.root)
+        self.metrics.time('server.resolve', start)
+        return callable(*call.args, **call.kw)
+
+    def _accept(self, frame):
+        if frame is None:
+            return []
+        session, ack, calls, event_ack = frame
+        with self._lock:
+            if session != self._session:
+                # A new client numbers its calls from scratch again.
+                self._session = session
+                self._last_id = 0
+                self._unacked = []
+                self._event_id = 0
+                self._events = []
+            # Forget results the client has confirmed to have received:
+            # those of calls it has sent before but no longer does. The ack
+            # alone would keep all results behind a long running call.
+            pending = [call[0] for call in calls]
+            last = pending[-1] if pending else ack
+            self._unacked = [
+                res for res in self._unacked
+                if res[0] > ack and (res[0] > last or res[0] in pending)]
+            self._events = [
+                event for event in self._events if event[0] > event_ack]
+        new = [RemoteCall(*call) for call in calls if call[0] > self._last_id]
+        if new:
+            self._last_id = new[-1].req_id
+        elif calls and (self._unacked or self._events):
+            # The client sent its calls again, so it may have missed the
+            # result frame.
+            with self._lock:
+                self._send()
+        return new
 
     def wait(self):
-        tools.print('Waiting for command.')
-        self.cmd_mbx.wait()
-        call = RemoteCall(*self.cmd_mbx.read())
-        tools.print('Received: %s' % call)
-        return call
+        if DEBUG:
+            tools.print('Waiting for command.')
+        while True:
+            start = metrics.now()
+            frame = self.cmd_mbx.read()
+            self.metrics.time('server.decode', start)
+            calls = self._accept(frame)
+            if calls:
+                break
+            self.cmd_mbx.wait()
+        if DEBUG:
+            for call in calls:
+                tools.print('Received: %s' % call)
+        return calls
+
+    def _send(self):
+        start = metrics.now()
+        self.res_mbx.send(
+            (self._last_id, tuple(self._unacked), tuple(self._events)))
+        self.metrics.time('server.encode', start)
+
+    def _push(self, name, data):
+        self._event_id += 1
+        self._events.append((self._event_id, name, data))
+        # Events are only acknowledged with the client's next call, so keep
+        # just the latest ones.
+        if len(self._events) > MAX_EVENTS:
+            self._events.pop(0)
+
+    def _send_event(self):
+        try:
+            self._send()
+        except Exception:
+            # Or no frame could be sent anymore.
+            self._events.pop()
+            raise
+
+    def push(self, name, data=None):
+        """Push an event to the client, see `RPCClient.subscribe`."""
+        with self._lock:
+            self._push(name, data)
+            self._send_event()
+
+    def respond(self, call, status, message, data, session=None):
+        with self._lock:
+            if session is not None and session != self._session:
+                # The call came from a client that has gone since.
+                return
+            if not call.oneway:
+                self._unacked.append((call.req_id, status, message, data))
+            elif status == 200:
+                self._push('DONE', call.req_id)
+            else:
+                self._push('ERROR', (call.req_id, message, data))
+            try:
+                self._send()
+            except Exception as err:
+                if call.oneway:
+                    raise
+                # Answer with the error instead, or no frame could be sent
+                # anymore.
+                self.metrics.count('server.errors')
+                self._unacked[-1] = (
+                    call.req_id, 500, err.__class__.__name__, str(err))
+                self._send()
+
+    def _push_to(self, session, name, data):
+        # Push an event, unless the client of `session` has gone since.
+        with self._lock:
+            if session == self._session:
+                self._push(name, data)
+                self._send_event()
+
+    def execute(self, call):
+        """Run a call and return its `(status, message, data, result)`."""
+        self.metrics.count('server.calls')
+        start = metrics.now()
+        try:
+            res = self.handle(call)
+        except ServerRpcError as err:
+            self.metrics.count('server.errors')
+            return (
+                err.status, err.error.__class__.__name__, str(err.error), None)
+        except Exception as err:
+            self.metrics.count('server.errors')
+            tools.print('-----')
+            tools.print('Caught exception:')
+            sys.print_exception(err)
+            tools.print(err)
+            tools.print('-----')
+            return 500, err.__class__.__name__, str(err), None
+        finally:
+            self.metrics.time('server.execute', start)
+        return 200, 'Ok', res, res
+
+    def dispatch(self, call):
+        waits = call.path == 'AT' and len(call.args) == 4
+        # Waiting for the time must not hold up other calls either.
+        owners = self._get_owners(call)
+        if not owners and not waits:
+            alloc = self.metrics.alloc_start()
+            status, message, data, res = self.execute(call)
+            self.respond(call, status, message, data)
+            self.metrics.allocated('server.alloc', alloc)
+            return res
+        locks = []
+        for owner in owners:
+            for lock in owner.locks:
+                if lock not in locks:
+                    locks.append(lock)
+        # Always in the same order, so that locking them cannot deadlock.
+        locks.sort(key=id)
+        # Motions run in the order they were called, not in the order the
+        # workers happen to get to their locks.
+        previous = []
+        for lock in locks:
+            if lock in self._tasks and self._tasks[lock] not in previous:
+                previous.append(self._tasks[lock])
+        motion = task.Task(
+            self._run_locked, (call, owners, locks, previous, self._session))
+        for lock in locks:
+            self._tasks[lock] = motion
+        motion.start()
+        if call.oneway:
+            # Let the client know the call has arrived.
+            with self._lock:
+                self._send()
+
+    def _run_locked(self, call, owners, locks, previous, session):
+        for each in previous:
+            each.join()
+        for lock in locks:
+            lock.acquire()
+        alloc = self.metrics.alloc_start()
+        stalled = ()
+        try:
+            status, message, data, _ = self.execute(call)
+            self.respond(call, status, message, data, session)
+            for owner in owners:
+                # Keep the legs locked until motions started without
+                # waiting have ended as well.
+                try:
+                    owner.join()
+                except Exception as err:
+                    self._push_to(session, 'ERROR', (
+                        call.req_id, err.__class__.__name__, str(err)))
+                stalled += owner.stalled()
+        finally:
+            for lock in locks:
+                lock.release()
+        if stalled:
+            self._push_to(session, 'STALLED', (call.req_id, stalled))
+        self.metrics.allocated('server.alloc', alloc)
 
     def run(self):
         while True:
             tools.print('Waiting for connection.')
             self._server.wait_for_connection(1)
             self.root.connect()
+            self.resolve_exports()
             tools.print('Connected.')
             res = None
             while res is not Quit:
-                call = self.wait()
-                try:
-                    res = self.handle(call)
-                except ServerRpcError as err:
-                    self.res_mbx.send((
-                        err.status,
-                        err.error.__class__.__name__, str(err.error)))
-                except Exception as err:
-                    tools.print('-----')
-                    tools.print('Caught exception:')
-                    sys.print_exception(err)
-                    tools.print(err)
-                    tools.print('-----')
-                    self.res_mbx.send((500, err.__class__.__name__, str(err)))
-                else:
-                    self.res_mbx.send((200, 'Ok', res))
+                for call in self.wait():
+                    res = self.dispatch(call)
+                    if res is Quit:
+                        break
 
 
 class RPCClient:
@@ -158,19 +589,240 @@ class RPCClient:
     cmd_mbx = None
     res_mbx = None
 
-    def __init__(self, server_brick_name):
-         self.server_brick_name = server_brick_name
+    def __init__(self, server_brick_name, codec=None, transport=None,
+                 recorder=None):
+        self.server_brick_name = server_brick_name
+        self.codec = codec if codec is not None else getDefaultCodec()
+        if recorder is not None:
+            self.codec = recorder.wrap(self.codec, server=False)
+        self.transport = (
+            transport if transport is not None else BluetoothTransport())
+        self._lock = _thread.allocate_lock()
+        self._recv_lock = _thread.allocate_lock()
+        self._session = None
+        self._next_id = 0
+        self._outbox = []
+        self._results = {}
+        self._handles = {}
+        self._event_id = 0
+        self._events = []
+        self._handlers = {}
+        self._listening = False
+        # Held while the listener runs.
+        self._listener = None
+        self._sleepers = []
+        # Result frames received, for noticing when they stop coming.
+        self._frames = 0
+        # Send times of the calls in flight, for the round trip times.
+        self._sent = {}
+        self.metrics = metrics.getRegistry()
 
     def connect(self):
         tools.print('Connecting to remote brick: ' + self.server_brick_name)
-        self._client = messaging.BluetoothMailboxClient()
+        self._client = self.transport.client()
         self._client.connect(self.server_brick_name)
         tools.print('Connected to %r.' % self.server_brick_name)
-        self.cmd_mbx = RPCMailbox(COMMAND_MAILBOX_NAME, self._client)
-        self.res_mbx = RPCMailbox(RESULT_MAILBOX_NAME, self._client)
+        self.cmd_mbx = self.transport.mailbox(
+            COMMAND_MAILBOX_NAME, self._client, self.codec)
+        self.res_mbx = self.transport.mailbox(
+            RESULT_MAILBOX_NAME, self._client, self.codec)
+        self._session = random.getrandbits(24)
+        self._next_id = 0
+        self._event_id = 0
+        self._outbox = []
+        self._sent = {}
+        # Learn the handles of the exported callables, so they do not need
+        # to be resolved by path on every call.
+        self._handles = {}
+        _thread.start_new_thread(self._resend, (self._session,))
+        exports = self.call_async('EXPORTS').result()
+        self._handles = {path: handle for handle, path in enumerate(exports)}
 
     def disconnect(self):
-        self.cmd_mbx.send(('QUIT', (), {}))
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            # Wake the listener with a round trip and wait for it to end,
+            # so that it does not send for this session after it has gone.
+            self._listening = False
+            self.call_async('PING').result()
+            listener.acquire()
+        self.call_async('QUIT')
+        with self._lock:
+            self._session = None
+
+    def batch(self):
+        return Batch(self)
+
+    def _call(self, path, args, kw, *flags):
+        self._wait_room()
+        with self._lock:
+            self._next_id += 1
+            req_id = self._next_id
+            self._sent[req_id] = metrics.now()
+            self._outbox.append(
+                (req_id, self._handles.get(path, path), args, kw or {})
+                + flags)
+            try:
+                self._send()
+            except Exception:
+                # Every later frame would fail to encode as well.
+                self._outbox.pop()
+                del self._sent[req_id]
+                raise
+        return req_id
+
+    def call_async(self, path, args=(), kw=None):
+        return RemoteFuture(self, self._call(path, args, kw))
+
+    def call_oneway(self, path, args=(), kw=None):
+        """Call `path` without waiting for it, and return the request ID.
+
+        No result is sent back, but a `DONE` or `ERROR` event with the
+        request ID once the call has finished, see `subscribe`.
+        """
+        return self._call(path, args, kw, True)
+
+    def call_at(self, time, path, args=(), kw=None):
+        """Call `path` at the given server time.
+
+        The result is a `(started, result)` tuple, with the server time at
+        which the call actually started.
+        """
+        return self.call_async(
+            'AT', (time, self._handles.get(path, path), args, kw or {}))
+
+    def _send(self):
+        if self._session is None:
+            # Disconnected, so the frame would overwrite the next client's.
+            return
+        # Everything below the oldest unanswered call has been received.
+        ack = self._outbox[0][0] - 1 if self._outbox else self._next_id
+        self.cmd_mbx.send(
+            (self._session, ack, tuple(self._outbox), self._event_id))
+
+    def _receive(self, frame):
+        if frame is None:
+            return
+        last_id, results, events = frame
+        with self._lock:
+            self._frames += 1
+            pending = [call[0] for call in self._outbox]
+            for res in results:
+                if res[0] in pending:
+                    self._results[res[0]] = res[1:]
+                    self.metrics.time('client.rtt', self._sent.pop(res[0]))
+            # One-way calls are done with as soon as the server has them.
+            outbox = []
+            for call in self._outbox:
+                if len(call) > 4 and call[0] <= last_id:
+                    self.metrics.time(
+                        'client.oneway_rtt', self._sent.pop(call[0]))
+                elif call[0] not in self._results:
+                    outbox.append(call)
+            self._outbox = outbox
+            for event in events:
+                if event[0] > self._event_id:
+                    self._event_id = event[0]
+                    self._events.append(event[1:])
+
+    def subscribe(self, name, handler):
+        """Call `handler(data)` for every event `name` the server pushes.
+
+        Handlers are run by `poll`, or by the thread started by `listen`.
+        """
+        self._handlers.setdefault(name, []).append(handler)
+
+    def unsubscribe(self, name, handler):
+        self._handlers[name].remove(handler)
+
+    def poll(self):
+        """Run the handlers of the events received so far."""
+        with self._lock:
+            if self._session is None:
+                return
+            events, self._events = self._events, []
+            if events:
+                # Acknowledge them right away, or the server keeps sending
+                # them until the next call.
+                self._send()
+        for name, data in events:
+            for handler in self._handlers.get(name, ()):
+                handler(data)
+
+    def listen(self):
+        """Receive and handle events in a thread of its own."""
+        if not self._listening:
+            self._listening = True
+            self._listener = _thread.allocate_lock()
+            self._listener.acquire()
+            _thread.start_new_thread(self._listen, (self._listener,))
+
+    def _listen(self, running):
+        try:
+            while self._listening:
+                self._wait_for(lambda: self._events or not self._listening)
+                self.poll()
+        finally:
+            running.release()
+
+    def _resend(self, session):
+        frames = self._frames
+        while True:
+            tools.wait(RESEND_TIMEOUT)
+            with self._lock:
+                if self._session != session:
+                    return
+                if self._outbox and self._frames == frames:
+                    self.metrics.count('client.resends')
+                    self._send()
+                frames = self._frames
+
+    def _wait_for(self, ready):
+        """Wait until `ready()` is true, receiving result frames meanwhile.
+
+        One thread at a time receives, the others sleep until it has got a
+        frame, which may have been what they were waiting for.
+        """
+        while not ready():
+            if not self._recv_lock.acquire(0):
+                self._sleep()
+                continue
+            try:
+                # Results may arrive in any order and in any frame, so
+                # check the latest frame before blocking for a new one.
+                self._receive(self.res_mbx.read())
+                if not ready():
+                    self.res_mbx.wait()
+                    self._receive(self.res_mbx.read())
+            finally:
+                self._recv_lock.release()
+                self._wake()
+
+    def _sleep(self):
+        wakeup = _thread.allocate_lock()
+        wakeup.acquire()
+        with self._lock:
+            self._sleepers.append(wakeup)
+        # The receiving thread may have finished in the meantime.
+        if self._recv_lock.locked():
+            wakeup.acquire()
+
+    def _wake(self):
+        with self._lock:
+            sleepers, self._sleepers = self._sleepers, []
+        for wakeup in sleepers:
+            wakeup.release()
+
+    def _wait_room(self):
+        """Wait until another call may be put in flight."""
+        self._wait_for(lambda: len(self._outbox) < MAX_IN_FLIGHT)
+
+    def _wait_result(self, req_id):
+        self._wait_for(lambda: req_id in self._results)
+        with self._lock:
+            return self._results.pop(req_id)
 
     def __getattr__(self, name):
-        return RemoteObject(name, self)
+        obj = RemoteObject(name, self)
+        setattr(self, name, obj)
+        return obj
@@ -0,0 +1,132 @@
+###############################################################################
+# SPDX-License-Identifier: MIT
+# Copyright 2020 by EV3 Robo Dog Authros
+###############################################################################
+"""Cooperative single-threaded scheduler for motions.
+
+Motions are generators that yield whenever they have to wait for their motors,
+e.g. until `control.done()`. The brick's control loop steps all of them once
+per tick from a single thread, so no thread per leg is needed just to wait.
+"""
+import _thread
+
+import loop
+
+_scheduler = None
+
+
+def getScheduler():
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = Scheduler(loop.ControlLoop())
+        _scheduler.loop.start()
+    return _scheduler
+
+
+def gather(*coros):
+    """Combine several coroutines into one that ends when all have ended."""
+    coros = list(coros)
+    while coros:
+        for coro in coros[:]:
+            try:
+                next(coro)
+            except StopIteration:
+                coros.remove(coro)
+        if coros:
+            yield
+
+
+def run(*coros):
+    """Run coroutines on the brick's control loop and wait for them."""
+    return getScheduler().run(*coros)
+
+
+def start(coro):
+    """Run a coroutine on the brick's control loop without waiting."""
+    return getScheduler().spawn(coro)
+
+
+class Job:
+
+    def __init__(self, coro):
+        self.coro = coro
+        self.value = None
+        self.error = None
+        self.lock = _thread.allocate_lock()
+        self.lock.acquire()
+
+    def step(self):
+        """Advance the coroutine and return whether it is still running."""
+        try:
+            next(self.coro)
+        except StopIteration as stop:
+            self.value = stop.value
+        except Exception as err:
+            self.error = err
+        else:
+            return True
+        self.lock.release()
+        return False
+
+    def done(self):
+        return not self.lock.locked()
+
+    def join(self):
+        self.lock.acquire()
+        self.lock.release()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class Scheduler:
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.jobs = []
+        self._lock = _thread.allocate_lock()
+        loop.add(self.step)
+
+    def spawn(self, coro):
+        job = Job(coro)
+        # The first step runs in the calling thread, so that the motion
+        # starts right away and argument errors are raised to the caller.
+        if job.step():
+            with self._lock:
+                self.jobs.append(job)
+        elif job.error is not None:
+            raise job.error
+        return job
+
+    def step(self):
+        with self._lock:
+            jobs = self.jobs
+            self.jobs = []
+        running = [job for job in jobs if job.step()]
+        with self._lock:
+            # Keep jobs that have been spawned in the meantime.
+            self.jobs = running + self.jobs
+
+    def run(self, *coros):
+        """Run coroutines and return the value of a single one."""
+        coro = coros[0] if len(coros) == 1 else gather(*coros)
+        return self.spawn(coro).join()
+
+
+class Motions:
+    """Keeps track of the motion an object started without waiting, so that
+    the RPC server can `join` it before releasing the object's `locks`."""
+
+    job = None
+
+    def run_motion(self, motion, wait):
+        if wait:
+            run(motion)
+        else:
+            self.job = start(motion)
+
+    def join(self):
+        """Wait for the motion started without waiting, if any."""
+        job, self.job = self.job, None
+        if job is not None:
+            job.join()
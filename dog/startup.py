@@ -0,0 +1,65 @@
+###############################################################################
+# SPDX-License-Identifier: MIT
+# Copyright 2020 by EV3 Robo Dog Authros
+###############################################################################
+"""Startup profiler recording the time spent in each phase of starting up.
+
+Import this module first, so that the time of the other imports is counted:
+
+    import startup
+    import constants, leg, rpc
+    startup.mark('imports')
+
+Sequential phases end with `mark`; phases that overlap with others, like the
+halves of the dog starting up in parallel, are timed with `now` and `record`.
+Times are in real milliseconds, also when the simulation runs faster.
+"""
+try:
+    from time import ticks_diff, ticks_ms
+except ImportError:
+    from time import monotonic
+
+    def ticks_ms():
+        return int(monotonic() * 1000)
+
+    def ticks_diff(end, start):
+        return end - start
+
+_start = ticks_ms()
+_last = _start
+_phases = []
+_reported = False
+
+
+def now():
+    return ticks_ms()
+
+
+def elapsed():
+    """Return the time since the start in milliseconds."""
+    return ticks_diff(ticks_ms(), _start)
+
+
+def record(name, start):
+    """Record a phase that began at `start`, as returned by `now`."""
+    _phases.append((name, ticks_diff(ticks_ms(), start)))
+
+
+def mark(name):
+    """Record the phase since the previous mark (or the start)."""
+    global _last
+    end = ticks_ms()
+    _phases.append((name, ticks_diff(end, _last)))
+    _last = end
+
+
+def report():
+    """Print the phases, only the first time, as the brick is up then."""
+    global _reported
+    if _reported:
+        return
+    _reported = True
+    from pybricks import tools
+    for name, duration in _phases:
+        tools.print('%-24s %6d ms' % (name, duration))
+    tools.print('%-24s %6d ms' % ('total', elapsed()))
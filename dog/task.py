@@ -2,33 +2,127 @@
 # SPDX-License-Identifier: MIT
 # Copyright 2020 by EV3 Robo Dog Authros
 ###############################################################################
-"""Generic implementation of an async Task and TaskGroup (read thread)."""
+"""Generic implementation of an async Task and TaskGroup (read thread).
+
+Tasks are run by a fixed-size pool of worker threads that are started once
+and then reused, since spawning a thread per task is expensive on the brick.
+"""
 import _thread
-from pybricks import tools
 
-JOIN_CHECK_INTERVAL = 10
+import metrics
+
+DEFAULT_POOL_SIZE = 4
+
+_pool = None
+
+
+def getPool():
+    global _pool
+    if _pool is None:
+        _pool = WorkerPool(DEFAULT_POOL_SIZE)
+    return _pool
+
+
+class Worker:
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.task = None
+        # Released whenever the worker is handed a task.
+        self.wakeup = _thread.allocate_lock()
+        self.wakeup.acquire()
+        _thread.start_new_thread(self.run, ())
+
+    def run(self):
+        while True:
+            self.wakeup.acquire()
+            task = self.task
+            while task is not None:
+                task.run()
+                task = self.pool.next(self)
+
+
+class WorkerPool:
+
+    def __init__(self, size):
+        self._lock = _thread.allocate_lock()
+        self._queue = []
+        self._idle = [Worker(self) for _ in range(size)]
+
+    def submit(self, task):
+        with self._lock:
+            if not self._idle:
+                self._queue.append(task)
+                return
+            worker = self._idle.pop()
+        worker.task = task
+        worker.wakeup.release()
+
+    def next(self, worker):
+        with self._lock:
+            if self._queue:
+                return self._queue.pop(0)
+            worker.task = None
+            self._idle.append(worker)
+
+    def steal(self, task):
+        """Take a task that has not been started yet out of the queue."""
+        with self._lock:
+            if task in self._queue:
+                self._queue.remove(task)
+                return True
+        return False
 
 
 class Task:
 
+    __slots__ = (
+        'func', 'args', 'kw', 'lock', 'pool', 'value', 'error', 'submitted')
+
     def __init__(self, func, args=(), kw=None):
         self.func = func
         self.args = args
         self.kw = kw or {}
         self.lock = _thread.allocate_lock()
-        self.id = None
+        self.pool = None
+        self.value = None
+        self.error = None
+        self.submitted = None
 
-    def start(self):
+    def start(self, pool=None):
         self.lock.acquire()
-        self.id = _thread.start_new_thread(self.run, ())
+        self.pool = pool if pool is not None else getPool()
+        self.submitted = metrics.now()
+        self.pool.submit(self)
 
     def run(self):
-        self.func(*self.args, **self.kw)
-        self.lock.release()
+        registry = metrics.getRegistry()
+        start = metrics.now()
+        if self.submitted is not None:
+            registry.time('task.wait', self.submitted)
+        try:
+            self.value = self.func(*self.args, **self.kw)
+        except Exception as err:
+            self.error = err
+        finally:
+            registry.time('task.run', start)
+            self.lock.release()
 
     def join(self):
-        while self.lock.locked():
-            tools.wait(JOIN_CHECK_INTERVAL)
+        if self.pool is None:
+            raise RuntimeError('task not started')
+        # Run the task in this thread, if no worker has picked it up yet.
+        # This also keeps nested task groups from starving the pool.
+        if self.pool.steal(self):
+            self.run()
+        self.lock.acquire()
+        self.lock.release()
+
+    def result(self):
+        self.join()
+        if self.error is not None:
+            raise self.error
+        return self.value
 
 
 class TaskGroup:
@@ -39,10 +133,17 @@ class TaskGroup:
     def add(self, func, args=(), kw=None):
         self.tasks.append(Task(func, args, kw))
 
-    def start(self):
+    def start(self, pool=None):
         for task in self.tasks:
-            task.start()
+            task.start(pool)
 
     def join(self):
         for task in self.tasks:
             task.join()
+        for task in self.tasks:
+            if task.error is not None:
+                raise task.error
+
+    def results(self):
+        self.join()
+        return [task.value for task in self.tasks]
@@ -0,0 +1,87 @@
+###############################################################################
+# SPDX-License-Identifier: MIT
+# Copyright 2020 by EV3 Robo Dog Authros
+###############################################################################
+"""Motor telemetry sampled into ring buffers on the control loop.
+
+The angle, speed and load of every motor are sampled at a fixed rate into
+preallocated arrays. A dump is a compact binary snapshot of the buffers,
+oldest sample first:
+
+    header   '<4sHHIH': magic, motors, fields, samples, rate
+    names    comma separated motor names, preceded by their length ('<H')
+    times    samples x int32, milliseconds on the brick's clock
+    values   samples x motors x fields x int16
+
+See `scripts/read_telemetry.py` for reading dumps on a PC.
+"""
+import struct
+from array import array
+
+import clock, constants
+
+MAGIC = b'TLM1'
+HEADER = '<4sHHIH'
+FIELDS = ('angle', 'speed', 'load')
+
+
+class Telemetry:
+
+    def __init__(self, motors, names, rate=constants.TELEMETRY_RATE,
+                 size=constants.TELEMETRY_SIZE):
+        self.motors = motors
+        self.names = names
+        self.rate = rate
+        self.size = size
+        self.times = array('i', [0] * size)
+        self.values = array('h', [0] * (size * len(motors) * len(FIELDS)))
+        # Not all firmware versions can measure the load.
+        self._has_load = all(hasattr(motor, 'load') for motor in motors)
+        self._sample = None
+        self.count = 0
+
+    def sample(self):
+        idx = self.count % self.size
+        self.times[idx] = clock.now()
+        pos = idx * len(self.motors) * len(FIELDS)
+        for motor in self.motors:
+            self.values[pos] = int(motor.angle())
+            self.values[pos + 1] = int(motor.speed())
+            self.values[pos + 2] = int(motor.load()) if self._has_load else 0
+            pos += len(FIELDS)
+        self.count += 1
+
+    def start(self, loop):
+        # Keep the bound method, so that `stop` removes the same object.
+        self._sample = self.sample
+        loop.add(self._sample, max(1, loop.rate // self.rate))
+
+    def stop(self, loop):
+        loop.remove(self._sample)
+
+    def dump(self):
+        count = min(self.count, self.size)
+        names = ','.join(self.names).encode()
+        out = [
+            struct.pack(
+                HEADER, MAGIC, len(self.motors), len(FIELDS), count,
+                self.rate),
+            struct.pack('<H', len(names)),
+            names,
+        ]
+        # Unroll the ring buffers, so that the oldest sample comes first.
+        if self.count <= self.size:
+            spans = ((0, self.count),)
+        else:
+            split = self.count % self.size
+            spans = ((split, self.size), (0, split))
+        stride = len(self.motors) * len(FIELDS)
+        for start, end in spans:
+            out.append(bytes(self.times[start:end]))
+        for start, end in spans:
+            out.append(bytes(self.values[start * stride:end * stride]))
+        return b''.join(out)
+
+    def save(self, path):
+        with open(path, 'wb') as file:
+            file.write(self.dump())
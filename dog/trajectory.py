@@ -0,0 +1,60 @@
+###############################################################################
+# SPDX-License-Identifier: MIT
+# Copyright 2020 by EV3 Robo Dog Authros
+###############################################################################
+"""Keyframe trajectories that are played back locally on a brick.
+
+A keyframe is a `(time, targets, speeds)` tuple: the time in milliseconds
+after the start of the trajectory at which the joints start moving to their
+target angles at the given speeds. Targets and speeds are ordered like
+`LegSet.motors()`. Uploading a whole trajectory in one message and playing it
+on the brick avoids an RPC round trip per step.
+"""
+from array import array
+
+import loop
+
+
+class Trajectory:
+
+    def __init__(self, keyframes, joints=4):
+        self.joints = joints
+        self.times = array('l')
+        self.targets = array('f')
+        self.speeds = array('f')
+        last = 0
+        for time, targets, speeds in keyframes:
+            if len(targets) != joints or len(speeds) != joints:
+                raise ValueError(
+                    'Expected %d targets and speeds per keyframe.' % joints)
+            if time < last:
+                raise ValueError('Keyframes are not in order: %d' % time)
+            last = time
+            self.times.append(time)
+            self.targets.extend(array('f', targets))
+            self.speeds.extend(array('f', speeds))
+
+    def __len__(self):
+        return len(self.times)
+
+    def play_coro(self, motors, repeat=1):
+        for _ in range(repeat):
+            start = loop.ticks_us()
+            offset = 0
+            for idx in range(len(self.times)):
+                due = self.times[idx] * 1000
+                while loop.ticks_diff(loop.ticks_us(), start) < due:
+                    yield
+                for motor in motors:
+                    motor.run_target(
+                        self.speeds[offset], self.targets[offset],
+                        wait=False)
+                    offset += 1
+            # The next repetition starts once the last keyframe is reached.
+            # A stalled motor never gets done, see `Leg._wait_done`.
+            for motor in motors:
+                while not motor.control.done() and not motor.control.stalled():
+                    yield
+            if any(motor.control.stalled() for motor in motors):
+                # Leave reporting the stall to the caller.
+                return
@@ -0,0 +1,298 @@
+###############################################################################
+# SPDX-License-Identifier: MIT
+# Copyright 2020 by EV3 Robo Dog Authros
+###############################################################################
+"""Socket transport for the RPC layer, alongside the Bluetooth mailboxes.
+
+The classes mirror `pybricks.messaging`: a server waits for a connection,
+a client connects to it and named mailboxes on both ends exchange messages
+over one connection. Every message is sent as a length-prefixed frame:
+
+    '<H' name length, name, '<I' data length, data
+
+Addresses are `(host, port)` tuples for TCP or paths for Unix sockets. The
+server keeps accepting new connections after a client went away, and the
+client reconnects with exponential backoff when the connection breaks.
+
+This module does not depend on pybricks, so the RPC layer can be stress
+tested on Linux and the bricks can be driven over Wi-Fi or USB networking.
+"""
+import _thread
+import os
+import socket
+import struct
+import time
+
+RECONNECT_ATTEMPTS = 8
+RECONNECT_DELAY = 0.1
+RECONNECT_MAX_DELAY = 2.0
+
+
+def _socket(address):
+    if isinstance(address, str):
+        return socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    return socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+
+
+def _address(address):
+    if isinstance(address, str):
+        return address
+    return socket.getaddrinfo(address[0], address[1])[0][-1]
+
+
+def _unlink(address):
+    # A Unix socket path left behind by a previous server makes bind fail.
+    if isinstance(address, str):
+        try:
+            os.remove(address)
+        except OSError:
+            pass
+
+
+def _close(sock):
+    # Shutting down first also wakes up a thread blocked on receiving.
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+    sock.close()
+
+
+def _recv_exact(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise OSError('Connection closed.')
+        data += chunk
+    return data
+
+
+class _Event:
+    """Minimal event built from a lock, for a single waiter."""
+
+    def __init__(self):
+        self._lock = _thread.allocate_lock()
+        self._lock.acquire()
+
+    def set(self):
+        if self._lock.locked():
+            try:
+                self._lock.release()
+            except RuntimeError:
+                pass
+
+    def wait(self):
+        self._lock.acquire()
+
+
+class SocketConnection:
+
+    def __init__(self, address):
+        self.address = address
+        self._sock = None
+        self._send_lock = _thread.allocate_lock()
+        self._lock = _thread.allocate_lock()
+        self._frames = {}
+        self._latest = {}
+        self._seqs = {}
+        self._events = {}
+        self._connected = _Event()
+        self.closed = False
+
+    def _event(self, name):
+        with self._lock:
+            event = self._events.get(name)
+            if event is None:
+                event = self._events[name] = _Event()
+            return event
+
+    def _deliver(self, name, data):
+        with self._lock:
+            self._latest[name] = data
+            self._seqs[name] = self._seqs.get(name, 0) + 1
+        self._event(name).set()
+
+    def _attach(self, sock):
+        # Like a mailbox, the peer always gets to see the latest message,
+        # even if it was sent while the connection was down.
+        for frame in self._frames.values():
+            sock.sendall(frame)
+        self._sock = sock
+        self._connected.set()
+
+    def _detach(self, sock):
+        if self._sock is sock:
+            self._sock = None
+        _close(sock)
+
+    def _receive(self, sock):
+        """Read frames until the connection breaks."""
+        try:
+            while True:
+                (size,) = struct.unpack('<H', _recv_exact(sock, 2))
+                name = _recv_exact(sock, size).decode()
+                (size,) = struct.unpack('<I', _recv_exact(sock, 4))
+                self._deliver(name, _recv_exact(sock, size))
+        except OSError:
+            pass
+        self._detach(sock)
+
+    def _disconnected(self):
+        """Called when a message cannot be sent for lack of a connection."""
+
+    def send(self, name, data):
+        name = name.encode()
+        frame = b''.join((
+            struct.pack('<H', len(name)), name,
+            struct.pack('<I', len(data)), data))
+        with self._send_lock:
+            self._frames[name] = frame
+            sock = self._sock
+            if sock is not None:
+                try:
+                    sock.sendall(frame)
+                    return
+                except OSError:
+                    self._detach(sock)
+            self._disconnected()
+
+    def read(self, name):
+        with self._lock:
+            return self._latest.get(name), self._seqs.get(name, 0)
+
+    def wait(self, name, seen):
+        event = self._event(name)
+        while True:
+            with self._lock:
+                if self._seqs.get(name, 0) != seen:
+                    return
+            event.wait()
+
+    def close(self):
+        self.closed = True
+        sock, self._sock = self._sock, None
+        if sock is not None:
+            _close(sock)
+
+
+class SocketMailboxServer(SocketConnection):
+
+    _listener = None
+
+    def wait_for_connection(self, count=1):
+        if self._listener is None:
+            self._listener = _socket(self.address)
+            self._listener.setsockopt(
+                socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            _unlink(self.address)
+            self._listener.bind(_address(self.address))
+            self._listener.listen(1)
+            _thread.start_new_thread(self._accept, ())
+        while self._sock is None:
+            self._connected.wait()
+
+    def _accept(self):
+        # Clients may come and go; mailbox contents survive reconnects. A
+        # new connection replaces the previous one, which may be dead
+        # without this end having noticed yet.
+        while not self.closed:
+            try:
+                sock, _ = self._listener.accept()
+            except OSError:
+                if self.closed:
+                    break
+                continue
+            with self._send_lock:
+                old = self._sock
+                try:
+                    self._attach(sock)
+                except OSError:
+                    _close(sock)
+                    continue
+                if old is not None:
+                    _close(old)
+            _thread.start_new_thread(self._receive, (sock,))
+
+    def close(self):
+        super().close()
+        if self._listener is not None:
+            self._listener.close()
+            _unlink(self.address)
+
+
+class SocketMailboxClient(SocketConnection):
+
+    def connect(self, brick=None):
+        """Connect to the server; the brick name is not needed for that."""
+        with self._send_lock:
+            self._reconnect()
+
+    def _disconnected(self):
+        self._reconnect()
+
+    def _reconnect(self):
+        delay = RECONNECT_DELAY
+        for attempt in range(RECONNECT_ATTEMPTS):
+            if self.closed:
+                break
+            sock = _socket(self.address)
+            try:
+                sock.connect(_address(self.address))
+                self._attach(sock)
+            except OSError:
+                sock.close()
+                time.sleep(delay)
+                delay = min(2 * delay, RECONNECT_MAX_DELAY)
+                continue
+            _thread.start_new_thread(self._receive, (sock,))
+            return
+        raise OSError('Cannot connect to %r.' % (self.address,))
+
+    def _receive(self, sock):
+        super()._receive(sock)
+        # Reconnect right away, so that messages from the server get through
+        # even if the client has nothing to send.
+        if not self.closed:
+            try:
+                with self._send_lock:
+                    if self._sock is None:
+                        self._reconnect()
+            except OSError:
+                pass
+
+
+class SocketMailbox:
+
+    def __init__(self, name, connection, encode=None, decode=None):
+        self.name = name
+        self.connection = connection
+        self.encode = encode if encode is not None else bytes
+        self.decode = decode if decode is not None else bytes
+        self._seen = 0
+
+    def send(self, value, brick=None):
+        self.connection.send(self.name, self.encode(value))
+
+    def read(self):
+        data, self._seen = self.connection.read(self.name)
+        return None if data is None else self.decode(data)
+
+    def wait(self):
+        self.connection.wait(self.name, self._seen)
+
+
+class SocketTransport:
+    """RPC transport over a TCP or Unix socket, see `rpc.BluetoothTransport`."""
+
+    def __init__(self, address):
+        self.address = address
+
+    def server(self):
+        return SocketMailboxServer(self.address)
+
+    def client(self):
+        return SocketMailboxClient(self.address)
+
+    def mailbox(self, name, connection, codec):
+        return SocketMailbox(name, connection, codec.encode, codec.decode)
@@ -0,0 +1 @@
+PYTHONPATH=sim:dog python3 sim/run_sim.py
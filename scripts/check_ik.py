@@ -0,0 +1,57 @@
+###############################################################################
+# SPDX-License-Identifier: MIT
+# Copyright 2020 by EV3 Robo Dog Authros
+###############################################################################
+"""Check that the IK solutions lead back to their foot positions.
+
+    python scripts/check_ik.py
+
+For every cell of the IK table grid of both leg classes that `ik.solve`
+reaches, the foot position of the solved joint angles must be within
+`TOLERANCE` of the cell. Exits with an error if one is not.
+"""
+import math
+import sys
+
+sys.path[:0] = ['sim', 'dog']
+
+import constants, ik, leg
+
+# Maximum distance in millimeters, allowing for the joint angles being
+# quantized to motor degrees.
+TOLERANCE = 1.0
+
+
+def check(leg_class, step=constants.IK_GRID_STEP):
+    """Return the number of cells checked and the failing ones."""
+    reach = leg_class.UPPER_LENGTH + leg_class.LOWER_LENGTH
+    checked = 0
+    failed = []
+    for row in range(int(reach / step) + 1):
+        for col in range(int(2 * reach / step) + 1):
+            x, y = col * step - reach, row * step
+            angles = ik.solve(leg_class, x, y)
+            if angles is None:
+                continue
+            checked += 1
+            foot = ik.forward(leg_class, *angles)
+            if math.hypot(foot[0] - x, foot[1] - y) > TOLERANCE:
+                failed.append(((x, y), angles, foot))
+    return checked, failed
+
+
+def main():
+    ok = True
+    for leg_class in (leg.FrontLeg, leg.BackLeg):
+        checked, failed = check(leg_class)
+        print('%s: %d cells checked, %d off' % (
+            leg_class.__name__, checked, len(failed)))
+        for (x, y), angles, foot in failed:
+            print('  (%.1f, %.1f) -> (%.1f, %.1f) -> (%.1f, %.1f)' % (
+                (x, y) + tuple(angles) + tuple(foot)))
+        ok = ok and not failed
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
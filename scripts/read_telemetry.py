@@ -0,0 +1,62 @@
+###############################################################################
+# SPDX-License-Identifier: MIT
+# Copyright 2020 by EV3 Robo Dog Authros
+###############################################################################
+"""Read a motor telemetry dump into NumPy arrays (CPython only).
+
+    python scripts/read_telemetry.py front.tlm
+
+See `dog/telemetry.py` for the dump format.
+"""
+import struct
+import sys
+
+import numpy
+
+MAGIC = b'TLM1'
+HEADER = '<4sHHIH'
+FIELDS = ('angle', 'speed', 'load')
+
+
+def read(data):
+    """Return the dump's rate, time array and a dict of per-motor arrays.
+
+    Every motor maps to a dict of field name to an array with one value per
+    sample.
+    """
+    magic, motors, fields, count, rate = struct.unpack_from(HEADER, data)
+    if magic != MAGIC:
+        raise ValueError('Not a telemetry dump.')
+    pos = struct.calcsize(HEADER)
+    (size,) = struct.unpack_from('<H', data, pos)
+    pos += 2
+    names = data[pos:pos+size].decode().split(',')
+    pos += size
+    times = numpy.frombuffer(data, '<i4', count, pos)
+    pos += times.nbytes
+    values = numpy.frombuffer(data, '<i2', count * motors * fields, pos)
+    values = values.reshape(count, motors, fields)
+    return rate, times, {
+        name: {
+            field: values[:, motor, idx]
+            for idx, field in enumerate(FIELDS[:fields])}
+        for motor, name in enumerate(names)}
+
+
+def load(path):
+    with open(path, 'rb') as file:
+        return read(file.read())
+
+
+def main():
+    rate, times, motors = load(sys.argv[1])
+    duration = (times[-1] - times[0]) / 1000 if len(times) else 0
+    print('%d samples at %d Hz over %.2fs' % (len(times), rate, duration))
+    for name, fields in motors.items():
+        print('%-24s' % name + ' '.join(
+            '%s %6d..%-6d' % (field, values.min(), values.max())
+            for field, values in fields.items() if len(values)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,20 @@
+###############################################################################
+# SPDX-License-Identifier: MIT
+# Copyright 2020 by EV3 Robo Dog Authros
+###############################################################################
+"""Simulated pybricks backend for running the dog on CPython.
+
+Put the `sim` directory in front of the path to use it instead of the real
+pybricks, e.g.:
+
+    PYTHONPATH=sim:dog python sim/run_sim.py
+
+Time is virtual and runs `PYBRICKS_SIM_SPEED` (default 10) times faster than
+real time, see `_clock`.
+"""
+import sys
+import traceback
+
+# MicroPython's way of printing a traceback, used throughout the dog code.
+if not hasattr(sys, 'print_exception'):
+    sys.print_exception = traceback.print_exception
@@ -0,0 +1,29 @@
+###############################################################################
+# SPDX-License-Identifier: MIT
+# Copyright 2020 by EV3 Robo Dog Authros
+###############################################################################
+"""Virtual clock shared by all simulated devices.
+
+Virtual time runs at a constant multiple of real time, so that threads
+waiting on it stay consistent with each other while the simulation runs
+faster than real time.
+"""
+import os
+import time
+
+SPEED = float(os.environ.get('PYBRICKS_SIM_SPEED', 10))
+
+_start = time.monotonic()
+
+
+def now():
+    """Return the virtual time in milliseconds."""
+    return (time.monotonic() - _start) * 1000 * SPEED
+
+
+def sleep(ms):
+    if ms > 0:
+        time.sleep(ms / 1000 / SPEED)
+    else:
+        # Still give other threads a chance to run.
+        time.sleep(0)
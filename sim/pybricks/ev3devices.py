@@ -0,0 +1,201 @@
+###############################################################################
+# SPDX-License-Identifier: MIT
+# Copyright 2020 by EV3 Robo Dog Authros
+###############################################################################
+"""Simulated `pybricks.ev3devices`.
+
+A motor follows a first-order kinematic model on the virtual clock: its speed
+approaches the commanded speed with time constant `TIME_CONSTANT`. Motors
+stop and stall at mechanical end stops, like the legs do when folded up.
+Angles are output shaft angles, so gears and direction need no modeling.
+"""
+import math
+import threading
+
+from pybricks import _clock, tools
+
+# Time constant of the motor speed in milliseconds.
+TIME_CONSTANT = 50
+# Integration step in milliseconds.
+STEP = 1
+# Speed below which a motor counts as standing still in deg/s.
+STALL_SPEED = 5
+# Time a motor has to be blocked before it counts as stalled in ms.
+STALL_TIME = 200
+# Distance to the target at which a motion counts as done in degrees.
+TARGET_TOLERANCE = 2
+
+# Mechanical end stops as output shaft angles; a leg is folded up at 0.
+END_STOPS = (0, 240)
+# Every motor starts a bit unfolded, so that the reset has to find the stop.
+START_ANGLE = 25
+
+# Output shaft angles by brick and port. Like a real leg, a leg stays where
+# it is when its motor is created anew.
+_positions = {}
+# The brick the current thread runs, see `set_brick`.
+_brick = threading.local()
+
+
+def set_brick(name):
+    """Tell which brick the calling thread runs.
+
+    Both bricks use the same ports, so that their motors do not share
+    positions. Threads that have not been told run the brick named ''.
+    """
+    _brick.name = name
+
+
+class Control:
+
+    def __init__(self, motor):
+        self._motor = motor
+        self.speed_limit = 1000
+        self.acceleration = 2000
+        self.actuation = 100
+
+    def limits(self, speed=None, acceleration=None, actuation=None):
+        if speed is None and acceleration is None and actuation is None:
+            return self.speed_limit, self.acceleration, self.actuation
+        if speed is not None:
+            self.speed_limit = speed
+        if acceleration is not None:
+            self.acceleration = acceleration
+        if actuation is not None:
+            self.actuation = actuation
+
+    def done(self):
+        motor = self._motor
+        motor._update()
+        if motor._mode == 'target':
+            return motor._target_reached
+        return motor._mode in ('stop', 'hold')
+
+    def stalled(self):
+        motor = self._motor
+        motor._update()
+        return motor._blocked_time >= STALL_TIME
+
+
+class Motor:
+
+    def __init__(self, port, positive_direction=None, gears=None):
+        self.port = port
+        self.control = Control(self)
+        self._lock = threading.RLock()
+        self._key = (getattr(_brick, 'name', ''), port)
+        self._position = _positions.get(self._key, float(START_ANGLE))
+        self._offset = 0.0
+        self._speed = 0.0
+        self._command = 0.0
+        self._mode = 'stop'
+        self._target = 0.0
+        self._target_reached = True
+        self._blocked_time = 0
+        self._time = _clock.now()
+
+    def _update(self):
+        with self._lock:
+            now = _clock.now()
+            elapsed = now - self._time
+            self._time = now
+            while elapsed > 0:
+                step = min(STEP, elapsed)
+                elapsed -= step
+                self._step(step)
+            _positions[self._key] = self._position
+
+    def _step(self, step):
+        if self._mode == 'target':
+            remaining = self._target - self._position
+            if abs(remaining) <= TARGET_TOLERANCE:
+                self._target_reached = True
+                command = 0.0
+            else:
+                # Slow down in time to stop at the target.
+                command = math.copysign(
+                    min(self._command, abs(remaining) * 1000 / TIME_CONSTANT),
+                    remaining)
+        elif self._mode == 'run':
+            command = self._command
+        else:
+            command = 0.0
+        self._speed += (command - self._speed) * min(1.0, step / TIME_CONSTANT)
+        position = self._position + self._speed * step / 1000
+        low, high = END_STOPS
+        blocked = (
+            (position <= low and command < 0) or
+            (position >= high and command > 0))
+        self._position = min(high, max(low, position))
+        if blocked:
+            self._speed = 0.0
+            self._blocked_time += step
+        elif abs(self._speed) > STALL_SPEED or not command:
+            self._blocked_time = 0
+
+    def angle(self):
+        self._update()
+        return int(round(self._position - self._offset))
+
+    def speed(self):
+        self._update()
+        return int(round(self._speed))
+
+    def load(self):
+        self._update()
+        # Blocked motors push with their full actuation.
+        return self.control.actuation if self._blocked_time else 0
+
+    def reset_angle(self, angle):
+        self._update()
+        self._offset = self._position - angle
+
+    def stop(self):
+        self._update()
+        self._mode = 'stop'
+        self._blocked_time = 0
+
+    brake = stop
+
+    def hold(self):
+        self._update()
+        self._mode = 'hold'
+        self._speed = 0.0
+
+    def run(self, speed):
+        self._update()
+        self._mode = 'run'
+        self._command = min(abs(speed), self.control.speed_limit) * (
+            1 if speed >= 0 else -1)
+
+    def run_target(self, speed, target_angle, then=None, wait=True):
+        self._update()
+        self._mode = 'target'
+        self._command = min(abs(speed), self.control.speed_limit)
+        self._target = target_angle + self._offset
+        self._target_reached = False
+        self._blocked_time = 0
+        if wait:
+            while not self.control.done():
+                tools.wait(10)
+
+    def run_angle(self, speed, rotation_angle, then=None, wait=True):
+        self.run_target(speed, self.angle() + rotation_angle, then, wait)
+
+
+class InfraredSensor:
+    """Infrared sensor whose pressed buttons are set by the simulation."""
+
+    pressed = {}
+
+    def __init__(self, port):
+        self.port = port
+
+    def keypad(self):
+        return list(self.pressed.get(1, ()))
+
+    def buttons(self, channel):
+        return list(self.pressed.get(channel, ()))
+
+    def distance(self):
+        return 100
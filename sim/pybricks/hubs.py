@@ -0,0 +1,24 @@
+###############################################################################
+# SPDX-License-Identifier: MIT
+# Copyright 2020 by EV3 Robo Dog Authros
+###############################################################################
+"""Simulated `pybricks.hubs`."""
+from pybricks import tools
+
+
+class Speaker:
+
+    def beep(self, frequency=500, duration=100):
+        tools.wait(duration)
+
+    def play_file(self, file_name):
+        tools.print('[sim] Playing %s' % file_name)
+
+    def say(self, text):
+        tools.print('[sim] Saying %r' % text)
+
+
+class EV3Brick:
+
+    def __init__(self):
+        self.speaker = Speaker()
@@ -0,0 +1,13 @@
+###############################################################################
+# SPDX-License-Identifier: MIT
+# Copyright 2020 by EV3 Robo Dog Authros
+###############################################################################
+"""Simulated `pybricks.media.ev3dev`."""
+
+
+class SoundFile:
+    DOG_BARK_1 = 'Dog bark 1.wav'
+    DOG_BARK_2 = 'Dog bark 2.wav'
+    DOG_GROWL = 'Dog growl.wav'
+    DOG_SNIFF = 'Dog sniff.wav'
+    DOG_WHINE = 'Dog whine.wav'
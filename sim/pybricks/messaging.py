@@ -0,0 +1,104 @@
+###############################################################################
+# SPDX-License-Identifier: MIT
+# Copyright 2020 by EV3 Robo Dog Authros
+###############################################################################
+"""Simulated `pybricks.messaging` connecting mailboxes in-process.
+
+Server and client must run in the same process; a client connects to the
+server that is waiting for a connection, whatever brick name it asks for.
+Messages are queued per mailbox, but like on the real bricks `read()` only
+returns the latest one.
+"""
+import threading
+from collections import deque
+
+_waiting = []
+_waiting_cond = threading.Condition()
+
+
+class Connection:
+
+    def __init__(self):
+        self.peer = None
+        self._cond = threading.Condition()
+        self._queues = {}
+        self._latest = {}
+
+    def _deliver(self, name, data):
+        with self._cond:
+            self._queues.setdefault(name, deque()).append(data)
+            self._cond.notify_all()
+
+    def _read(self, name):
+        with self._cond:
+            queue = self._queues.get(name)
+            while queue:
+                self._latest[name] = queue.popleft()
+            return self._latest.get(name)
+
+    def _wait(self, name):
+        with self._cond:
+            while not self._queues.get(name):
+                self._cond.wait()
+
+    def send(self, name, data):
+        if self.peer is None:
+            raise OSError('Not connected.')
+        self.peer._deliver(name, data)
+
+
+class BluetoothMailboxServer(Connection):
+
+    def wait_for_connection(self, count=1):
+        with _waiting_cond:
+            _waiting.append(self)
+            _waiting_cond.notify_all()
+            while self.peer is None:
+                _waiting_cond.wait()
+
+    def close(self):
+        self.peer = None
+
+
+class BluetoothMailboxClient(Connection):
+
+    def connect(self, brick):
+        with _waiting_cond:
+            while not _waiting:
+                _waiting_cond.wait()
+            server = _waiting.pop(0)
+            server.peer = self
+            self.peer = server
+            _waiting_cond.notify_all()
+
+    def close(self):
+        if self.peer is not None:
+            self.peer.peer = None
+        self.peer = None
+
+
+class Mailbox:
+
+    def __init__(self, name, connection, encode=None, decode=None):
+        self.name = name
+        self.connection = connection
+        self.encode = encode if encode is not None else bytes
+        self.decode = decode if decode is not None else bytes
+
+    def send(self, value, brick=None):
+        self.connection.send(self.name, self.encode(value))
+
+    def read(self):
+        data = self.connection._read(self.name)
+        return None if data is None else self.decode(data)
+
+    def wait(self):
+        self.connection._wait(self.name)
+
+    def wait_new(self):
+        old = self.read()
+        while True:
+            self.wait()
+            new = self.read()
+            if new != old:
+                return new
@@ -0,0 +1,50 @@
+###############################################################################
+# SPDX-License-Identifier: MIT
+# Copyright 2020 by EV3 Robo Dog Authros
+###############################################################################
+"""Simulated `pybricks.parameters`."""
+
+
+class _Enum:
+
+    def __init__(self, cls, name):
+        self.name = name
+        self._cls = cls
+
+    def __repr__(self):
+        return '%s.%s' % (self._cls, self.name)
+
+
+def _enum(cls):
+    for name in cls.__dict__.get('MEMBERS', ()):
+        setattr(cls, name, _Enum(cls.__name__, name))
+    return cls
+
+
+@_enum
+class Port:
+    MEMBERS = ('A', 'B', 'C', 'D', 'S1', 'S2', 'S3', 'S4')
+
+
+@_enum
+class Direction:
+    MEMBERS = ('CLOCKWISE', 'COUNTERCLOCKWISE')
+
+
+@_enum
+class Stop:
+    MEMBERS = ('COAST', 'BRAKE', 'HOLD')
+
+
+@_enum
+class Button:
+    MEMBERS = (
+        'LEFT_DOWN', 'DOWN', 'RIGHT_DOWN', 'LEFT', 'CENTER', 'RIGHT',
+        'LEFT_UP', 'UP', 'BEACON', 'RIGHT_UP')
+
+
+@_enum
+class Color:
+    MEMBERS = (
+        'BLACK', 'BLUE', 'GREEN', 'YELLOW', 'RED', 'WHITE', 'BROWN',
+        'ORANGE', 'PURPLE')
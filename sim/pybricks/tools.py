@@ -0,0 +1,37 @@
+###############################################################################
+# SPDX-License-Identifier: MIT
+# Copyright 2020 by EV3 Robo Dog Authros
+###############################################################################
+"""Simulated `pybricks.tools` running on the virtual clock."""
+from pybricks import _clock
+
+print = print
+
+
+def wait(time):
+    _clock.sleep(time)
+
+
+class StopWatch:
+
+    def __init__(self):
+        self._start = _clock.now()
+        self._paused = None
+
+    def time(self):
+        now = self._paused if self._paused is not None else _clock.now()
+        return int(now - self._start)
+
+    def pause(self):
+        if self._paused is None:
+            self._paused = _clock.now()
+
+    def resume(self):
+        if self._paused is not None:
+            self._start += _clock.now() - self._paused
+            self._paused = None
+
+    def reset(self):
+        self._start = _clock.now()
+        if self._paused is not None:
+            self._paused = self._start
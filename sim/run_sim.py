@@ -0,0 +1,67 @@
+###############################################################################
+# SPDX-License-Identifier: MIT
+# Copyright 2020 by EV3 Robo Dog Authros
+###############################################################################
+"""Run both bricks of the dog in one process against simulated hardware.
+
+    PYTHONPATH=sim:dog python sim/run_sim.py
+
+The dog is started twice, to show that the second start skips the reset by
+using the calibrations saved on the first disconnect. Files are written to a
+temporary directory.
+"""
+import _thread
+import os
+import tempfile
+
+from pybricks import ev3devices, tools
+
+import dog, front, rpc
+
+
+def start_front():
+    root = front.Front()
+    server = rpc.RPCServer(
+        root, rpc.getDefaultCodec(front.constants.RPC_PATHS),
+        front.constants.RPC_PATHS)
+    root.state = front.mirror.StatePublisher(root.legs, server.push)
+    server.connect()
+    _thread.start_new_thread(run_front, (server,))
+    return server
+
+
+def run_front(server):
+    # The front motors are created by the server when a client connects.
+    ev3devices.set_brick('front')
+    server.run()
+
+
+def boot():
+    robot = dog.Dog('sim-front')
+    robot.connect()
+    robot.reset()
+    return robot
+
+
+def main():
+    os.chdir(tempfile.mkdtemp())
+    start_front()
+    robot = boot()
+    watch = tools.StopWatch()
+    for name, action in (
+            ('stand up', lambda: robot.stand_up(100)),
+            ('sit', robot.sit),
+            ('stand up', lambda: robot.stand_up(100)),
+            ('walk', lambda: robot.walk('trot', 1)),
+            ('lie down', lambda: robot.stand_up(0))):
+        start = watch.time()
+        action()
+        tools.print('%-10s %6d ms (virtual)' % (name, watch.time() - start))
+    tools.print('angles', robot.angles())
+    tools.print('sync', robot.sync.stats())
+    robot.disconnect()
+    boot().disconnect()
+
+
+if __name__ == '__main__':
+    main()